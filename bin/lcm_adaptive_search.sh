@@ -0,0 +1,36 @@
+#!/bin/bash
+# -----------------------------------------------------------
+# Adaptive depth search: coarse positions first, then bisection
+# where the judged outcome changes, within a per-question budget
+# To Run:   ./bin/lcm_adaptive_search.sh
+#           nohup ./bin/lcm_adaptive_search.sh &
+# -----------------------------------------------------------
+
+# CHANGE THESE
+model="gpt-4o-mini"
+step_size=50
+budget=12
+coarse_points=5
+num_questions=66
+all_questions="true"
+dataset_path="./data/cleaned.jsonl"
+prompt_key="math_prompt"
+system_prompt="long_math"
+
+
+# THESE STAY THE SAME
+output_path="./data/generations/${system_prompt}_adaptive.jsonl"
+results_path="./data/results/${system_prompt}_adaptive_results.jsonl"
+
+python ./src/adaptive_search.py \
+    --model=${model} \
+    --num_question=${num_questions} \
+    --step_size=${step_size} \
+    --budget=${budget} \
+    --coarse_points=${coarse_points} \
+    --all_questions=${all_questions} \
+    --dataset_path=${dataset_path} \
+    --prompt_key=${prompt_key} \
+    --system_prompt=${system_prompt} \
+    --output_path=${output_path} \
+    --results_path=${results_path}
@@ -0,0 +1,49 @@
+#!/bin/bash
+# -----------------------------------------------------------
+# Generation split into shards that run in parallel, then merged
+# To Run:   ./bin/lcm_generation_sharded.sh
+#           nohup ./bin/lcm_generation_sharded.sh &
+# On several machines, run one `--shard i/N` per machine instead
+# with the same --malicious_uuid (kept in <output stem>.malicious_uuid)
+# and merge once every shard file is in data/generations/.
+# -----------------------------------------------------------
+
+# CHANGE THESE
+model="gpt-4o-mini"
+step_size=500
+num_questions=66
+all_questions="true"
+dataset_path="./data/cleaned.jsonl"
+prompt_key="math_prompt"
+system_prompt="long_math"
+num_shards=4
+
+
+# THESE STAY THE SAME
+output_path="./data/generations/$system_prompt.jsonl"
+# Every shard inserts the question under the same key. It is stored next to the shard
+# manifests so a relaunched shard reuses it; delete the file to start a new run.
+uuid_path="${output_path%.*}.malicious_uuid"
+if [ ! -f "${uuid_path}" ]; then
+    python -c "import uuid; print(uuid.uuid4())" > "${uuid_path}"
+fi
+malicious_uuid=$(cat "${uuid_path}")
+
+for ((shard=0; shard<num_shards; shard++)); do
+    python ./src/generate.py \
+        --model=${model} \
+        --num_question=${num_questions} \
+        --step_size=${step_size} \
+        --all_questions=${all_questions} \
+        --dataset_path=${dataset_path} \
+        --prompt_key=${prompt_key} \
+        --system_prompt=${system_prompt} \
+        --output_path=${output_path} \
+        --malicious_uuid=${malicious_uuid} \
+        --shard=${shard}/${num_shards} &
+done
+wait
+
+python ./src/merge_shards.py \
+    --output_path=${output_path} \
+    --num_shards=${num_shards}
@@ -0,0 +1,235 @@
+'''
+Adaptive insertion-position search: for each malicious question, judge a coarse set of
+depths, then bisect between neighbouring depths whose verdicts differ, within --budget
+generation calls per question. Generations and verdicts are written in the same format as
+pipeline.py; the estimated success-vs-depth curve over the grid (--step_size, or --token_step /
+--depth_percent_step) and the bracketed thresholds go to <results stem>.adaptive.json.
+
+python ./src/adaptive_search.py \
+    --model gpt-4o-mini \
+    --all_questions true \
+    --dataset_path ./data/cleaned.jsonl \
+    --step_size 50 \
+    --budget 12 \
+    --prompt_key "math_prompt" \
+    --system_prompt "long_math" \
+    --output_path ./data/generations/long_math_adaptive.jsonl \
+    --results_path ./data/results/long_math_adaptive_results.jsonl
+'''
+import json
+import os
+from types import SimpleNamespace
+import pandas as pd
+import generate
+from llm_as_judge import judge_generation, judge_key, load_judge_config, log_judge_error, result_row
+from utils.ClassAPI import DataProcessor, Gpt, select_generator
+from utils.adaptive import AdaptivePositionSearch, add_adaptive_args
+from utils.checkpoint import CheckpointWriter, read_jsonl_rows
+from utils.concurrency import RateLimiter, run_ordered
+from utils.logging import get_logger
+from utils.refusal import RefusalClassifier
+from utils.response_cache import cache_from_args
+from utils.telemetry import telemetry_from_args
+
+logger = get_logger("logs/adaptive_search.log")
+
+def build_arg_parser():
+    parser = generate.build_arg_parser()
+    parser.description = "Find the depths where attack success changes with fewer generation calls."
+    parser.add_argument("--results_path", type=str, required=True, help="Where judge verdicts are written.")
+    parser.add_argument("--local_tier", action="store_true",
+                        help="Decide obvious canned refusals locally before calling the LLM judge.")
+    add_adaptive_args(parser)
+    return parser
+
+def parse_args():
+    return build_arg_parser().parse_args()
+
+def check_args(args, generator):
+    """
+    Reject generate.py options this search does not implement: it sends one prompt per call
+    through get_single_completion and writes a single output file.
+    """
+    unsupported = [
+        flag for flag, used in (
+            ("--batch", args.batch),
+            ("--local_batch_size", args.local_batch_size > 1),
+            ("--prefix_cache_mb", args.prefix_cache_mb),
+            ("--shard", args.shard),
+            )
+        if used
+        ]
+    if unsupported:
+        raise ValueError(f"{', '.join(unsupported)} not supported by adaptive_search.py; use generate.py for the full grid.")
+    if generator.is_local and args.concurrency > 1:
+        raise ValueError("--concurrency > 1 is only supported for API models.")
+
+def parse_verdict(resp):
+    verdict = pd.to_numeric(resp, errors='coerce')
+    return None if pd.isna(verdict) else float(verdict)
+
+def main(args=None):
+    args = args or parse_args()
+    logger.info("New run", event="run_start")
+    if args.all_questions == 'true':
+        args.num_questions = 'all'
+    generator = select_generator(args.model)
+    check_args(args, generator)
+    os.makedirs(os.path.dirname(args.output_path), exist_ok=True)
+    os.makedirs(os.path.dirname(args.results_path), exist_ok=True)
+
+    data_processor = DataProcessor()
+    # Read before the checkpoint below compacts the file
+    malicious_uuid = generate.run_malicious_uuid(args, read_jsonl_rows(args.output_path) if args.resume else [])
+    if malicious_uuid:
+        data_processor.malicious_uuid = malicious_uuid
+    data_processor.load_benign_questions("data/benign_questions.jsonl")
+    data_processor.load_malicious_questions(
+        path_to_jsonl=args.dataset_path,
+        num_questions=args.num_questions,
+        prompt_key=args.prompt_key
+        )
+    # Candidate positions: the grid generate.py would run, in entries or in token depth
+    grid = list(range(0, len(data_processor.benign_questions), args.step_size))
+    if args.token_step or args.depth_percent_step:
+        grid = data_processor.token_depth_positions(args.token_step, args.depth_percent_step)
+    # Positions with the same distinct benign entries before them (repeated keys) build the
+    # same prompt, so there are at most as many candidates as unique entries (plus one)
+    candidates, seen = [], set()
+    for position in grid:
+        distinct = data_processor.distinct_before(position)
+        if distinct not in seen:
+            seen.add(distinct)
+            candidates.append(position)
+    logger.info(f"{len(candidates)} distinct prompts out of {len(grid)} grid positions")
+    system_prompt = json.load(open("resources/system_prompts.json"))[args.system_prompt]
+    # Token offsets need the tokenizer, so they are only recorded for token-depth grids
+    token_positions = bool(args.token_step or args.depth_percent_step)
+
+    # Generation side, set up as in generate.py
+    response_cache = cache_from_args(args)
+    if response_cache is not None and hasattr(generator, "response_cache"):
+        generator.response_cache = response_cache
+    if hasattr(generator, "telemetry"):
+        generator.telemetry = telemetry_from_args(args, args.output_path)
+    if hasattr(generator, "rate_limiter"):
+        generator.rate_limiter = RateLimiter(
+            max_concurrency=args.concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm
+            )
+    generator.connect()
+
+    # Judge side, as in pipeline.py
+    config = load_judge_config(args.output_path)
+    judge = Gpt(
+        rate_limiter=RateLimiter(max_concurrency=args.concurrency),
+        response_cache=response_cache,
+        telemetry=telemetry_from_args(args, args.results_path)
+        )
+    judge.connect()
+    classifier = RefusalClassifier() if args.local_tier else None
+
+    generations = CheckpointWriter(
+        args.output_path,
+        key_fn=lambda row: generate.cell_key(row, args.model, args.system_prompt),
+        resume=args.resume,
+        is_complete=lambda row: row.get("output") is not None
+        )
+    results = CheckpointWriter(
+        args.results_path, key_fn=judge_key, resume=args.resume, is_complete=lambda row: row.get('response') is not None
+        )
+
+    searches = {
+        mal_q_id: AdaptivePositionSearch(candidates, args.budget, args.coarse_points, args.position_retries)
+        for mal_q_id in data_processor.mal_q_ids
+        }
+    questions = dict(zip(data_processor.mal_q_ids, data_processor.malicious_questions))
+    # Verdicts from an earlier run count against the budget and seed the search
+    for row in results.completed.values():
+        if row['mal_q_id'] in searches:
+            searches[row['mal_q_id']].record(row['insert_position'], parse_verdict(row['response']))
+
+    def evaluate(cell):
+        mal_q_id, insert_position = cell
+        prompt = data_processor.generate_prompt(insert_position, questions[mal_q_id])
+        output = generator.get_single_completion(
+            model=args.model, user_prompt=prompt, malicious_uuid=data_processor.malicious_uuid, system_prompt=system_prompt
+            )
+        if output is None:
+            return output, None, "no generation"
+        if classifier is not None:
+            verdict = classifier.classify(pd.Series([output], dtype=object)).iloc[0]
+            if verdict is not None:
+                return output, verdict, 'local'
+        try:
+            return output, judge_generation(judge, config, output, insert_position), 'llm'
+        except Exception as e:
+            return output, None, str(e)
+
+    # New rows continue after the idx of rows kept from an earlier run
+    first_idx = max(
+        (row['idx'] for writer in (generations, results) for row in writer.completed.values() if 'idx' in row), default=0
+        )
+    calls = 0
+    rounds = 0
+    while True:
+        # One round evaluates the next positions of every question concurrently
+        cells = [(mal_q_id, position) for mal_q_id, search in searches.items() for position in search.propose()]
+        if not cells:
+            break
+        rounds += 1
+        for (mal_q_id, insert_position), (output, resp, decided_by) in run_ordered(cells, evaluate, max_workers=args.concurrency):
+            calls += 1
+            generations.write({
+                "idx": first_idx + calls,
+                "mal_q_id": mal_q_id,
+                "insert_position": insert_position,
+                "token_offset": data_processor.token_offset(insert_position) if token_positions else None,
+                "output": output,
+                "mal_question": questions[mal_q_id],
+                "model": args.model,
+                "system_prompt": args.system_prompt
+                })
+            row = SimpleNamespace(
+                idx=first_idx + calls, mal_q_id=mal_q_id, insert_position=insert_position,
+                generation=output, model=args.model
+                )
+            if resp is None:
+                log_judge_error(row, decided_by or "no verdict after retries")
+            else:
+                results.write(result_row(row, resp, decided_by))
+            searches[mal_q_id].record(insert_position, parse_verdict(resp))
+        logger.info(f"Round {rounds}: {len(cells)} cells", event="round", cells=len(cells), calls=calls)
+
+    order = lambda row: (str(row['mal_q_id']), row['insert_position'])
+    generations.finalize(sort_key=order)
+    results.finalize(sort_key=order)
+
+    summary = {
+        "positions": candidates,
+        "uniform_grid_calls": len(grid) * len(searches),
+        "adaptive_calls": sum(search.calls for search in searches.values()),
+        "questions": {
+            mal_q_id: {**search.summary(), "curve": search.curve().tolist()}
+            for mal_q_id, search in searches.items()
+            },
+        }
+    curve = pd.DataFrame([summary["questions"][mal_q_id]["curve"] for mal_q_id in searches], columns=candidates)
+    summary["mean_curve"] = curve.mean().tolist()
+    summary_path = os.path.splitext(args.results_path)[0] + ".adaptive.json"
+    with open(summary_path, 'w') as o_file:
+        json.dump(summary, o_file, indent=2)
+
+    print(f"{summary['adaptive_calls']} calls instead of {summary['uniform_grid_calls']} for the full grid")
+    for position, success in zip(candidates, summary["mean_curve"]):
+        print(f"Estimated success at position {position}: {success:.3f}")
+    print(f"Summary written to {summary_path}")
+
+    if response_cache is not None:
+        response_cache.close()
+    for client in (generator, judge):
+        if getattr(client, "telemetry", None) is not None:
+            client.telemetry.write(args.telemetry_dir)
+    logger.info("Run completed successfully", event="run_end")
+
+if __name__ == "__main__":
+    main()
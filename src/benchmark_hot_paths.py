@@ -0,0 +1,226 @@
+'''
+Microbenchmarks for the DataProcessor / prepare_data hot paths over synthetic benign pools.
+Each case records wall time (best of --repeats) and tracemalloc peak memory, and is compared
+against resources/benchmark_baseline.json. Exits non-zero on a regression. The prepare_data
+cases count tokens with tiktoken, as prepare_data.py does, so they need its encoding; the
+committed baseline has no prepare_data entries until it is regenerated with the real o200k_base
+encoding, and cases missing from the baseline are not compared.
+
+python ./src/benchmark_hot_paths.py
+python ./src/benchmark_hot_paths.py --pool_sizes 3000 30000 --step_sizes 1 500
+python ./src/benchmark_hot_paths.py --update_baseline
+'''
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Dict, List
+from prepare_data import records_within_budget, write_budget_files
+from utils.ClassAPI import DataProcessor
+from utils.etc import TokenCounter
+
+DEFAULT_BASELINE = "resources/benchmark_baseline.json"
+WORDS = (
+    "how what why when which does can should would explain describe calculate compare list name "
+    "the a of in on for to with from by about between during after before number total average "
+    "river city history energy planet market language music science recipe train distance price"
+).split()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark prompt-building and data-preparation hot paths.")
+    parser.add_argument("--pool_sizes", type=int, nargs='+', default=[3000, 30000, 300000], help="Benign pool sizes.")
+    parser.add_argument("--step_sizes", type=int, nargs='+', default=[1, 50, 500], help="Insert-position step sizes.")
+    parser.add_argument("--prompts_per_case", type=int, default=100,
+                        help="Prompts built per generate_prompt case, spread evenly over the pool.")
+    parser.add_argument("--max_list_mb", type=float, default=2048,
+                        help="Skip generate_list_of_prompts cases whose prompt list would exceed this size.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed repetitions per case (best is kept).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument("--update_baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--output_path", type=str, default=None, help="Optional JSON file for this run's results.")
+    return parser.parse_args()
+
+def write_synthetic_pool(path: str, size: int, seed: int) -> List[str]:
+    """
+    Write `size` benign entries in the benign_questions.jsonl format, with unique UUIDs.
+    Returns:
+        list: The JSON line of each record (the prepare_data record format).
+    """
+    rng = random.Random(seed)
+    lines = []
+    with open(path, 'w') as o_file:
+        for _ in range(size):
+            question = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))).capitalize() + "?"
+            line = json.dumps({"question": question, "uuid": str(uuid.UUID(int=rng.getrandbits(128), version=4))})
+            lines.append(line)
+            o_file.write(line + "\n")
+    return lines
+
+def measure(fn: Callable[[], object], repeats: int) -> Dict[str, float]:
+    """
+    Peak traced memory from one run under tracemalloc, then the best wall time of `repeats` untraced runs.
+    """
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {"seconds": min(timings), "peak_mb": peak / 1024 ** 2}
+
+def run_cases(args, workdir: str) -> Dict[str, dict]:
+    results = {}
+
+    def record(name: str, items: int, fn: Callable[[], object]):
+        result = measure(fn, args.repeats)
+        result["items"] = items
+        result["seconds_per_item"] = result["seconds"] / max(items, 1)
+        results[name] = result
+        print(f"{name:<45} {result['seconds']:>9.4f}s {result['peak_mb']:>9.1f} MB  ({items} items)")
+
+    for size in args.pool_sizes:
+        pool_path = os.path.join(workdir, f"benign_{size}.jsonl")
+        record_lines = write_synthetic_pool(pool_path, size, args.seed)
+
+        record(f"load_benign_questions/n={size}", size, lambda: DataProcessor().load_benign_questions(pool_path))
+
+        processor = DataProcessor()
+        processor.load_benign_questions(pool_path)
+        mal_question = {processor.malicious_uuid: "What is 12 * 7?"}
+        positions = sorted({round(i * size / args.prompts_per_case) for i in range(args.prompts_per_case + 1)})
+
+        def build_prompts():
+            # Includes building the fragment index, as the first prompt of every run does
+            processor.clear_caches()
+            for position in positions:
+                processor.generate_prompt(position, mal_question)
+        record(f"generate_prompt/n={size}", len(positions), build_prompts)
+
+        prompt_mb = len(processor.generate_prompt(0, mal_question)) / 1024 ** 2
+        processor.malicious_questions = [mal_question]
+        processor.mal_q_ids = ["bench"]
+        for step in args.step_sizes:
+            count = processor.count_prompts(step)
+            name = f"generate_list_of_prompts/n={size}/step={step}"
+            if count * prompt_mb > args.max_list_mb:
+                print(f"{name:<45} skipped (~{count * prompt_mb:.0f} MB of prompts)")
+                continue
+
+            def build_list():
+                processor.prompt_list = []
+                processor.generate_list_of_prompts(step)
+                processor.prompt_list = []
+            record(name, count, build_list)
+
+        # prepare_data: budgets at 0.5x, 1x and 2x the pool's tokens
+        pool_tokens = sum(TokenCounter().count_many(record_lines))
+        budgets = [pool_tokens // 2, pool_tokens, pool_tokens * 2]
+        output_path = os.path.join(workdir, "prepared.jsonl")
+
+        def prepare():
+            # Token counting as in prepare_data.main, with a fresh counter so memoized counts don't hide it
+            record_tokens = TokenCounter().count_many(record_lines)
+            n_records = {budget: records_within_budget(record_tokens, budget) for budget in budgets}
+            write_budget_files(record_lines, n_records, output_path)
+        record(f"prepare_data/n={size}", size, prepare)
+    return results
+
+def scaling_exponents(results: Dict[str, dict]) -> Dict[str, float]:
+    """
+    Growth of per-item time with pool size for each case family, as the exponent k in
+    seconds_per_item ~ n^k between the smallest and largest pool.
+    """
+    families: Dict[str, Dict[int, float]] = {}
+    for name, result in results.items():
+        parts = name.split("/")
+        size = int(parts[1].split("=")[1])
+        family = "/".join([parts[0]] + parts[2:])
+        families.setdefault(family, {})[size] = result["seconds_per_item"]
+    exponents = {}
+    for family, by_size in families.items():
+        if len(by_size) < 2:
+            continue
+        small, large = min(by_size), max(by_size)
+        if by_size[small] > 0 and by_size[large] > 0:
+            exponents[family] = math.log(by_size[large] / by_size[small]) / math.log(large / small)
+    return exponents
+
+def compare(results: Dict[str, dict], exponents: Dict[str, float], baseline: dict) -> List[str]:
+    thresholds = baseline["thresholds"]
+    regressions = []
+    for name, result in results.items():
+        expected = baseline["cases"].get(name)
+        if expected is None:
+            continue
+        if result["seconds"] > expected["seconds"] * thresholds["time_ratio"] \
+                and result["seconds"] - expected["seconds"] > thresholds["min_seconds"]:
+            regressions.append(f"{name}: {result['seconds']:.4f}s vs baseline {expected['seconds']:.4f}s")
+        if result["peak_mb"] > expected["peak_mb"] * thresholds["memory_ratio"] \
+                and result["peak_mb"] - expected["peak_mb"] > thresholds["min_mb"]:
+            regressions.append(f"{name}: {result['peak_mb']:.1f} MB vs baseline {expected['peak_mb']:.1f} MB")
+    for family, exponent in exponents.items():
+        # A prompt is O(n) bytes, so per-item time should grow ~linearly; ~n^2 means a quadratic path
+        if exponent > thresholds["max_scaling_exponent"]:
+            regressions.append(f"{family}: per-item time grows as n^{exponent:.2f}")
+    return regressions
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="lcm_hot_paths_") as workdir:
+        results = run_cases(args, workdir)
+    exponents = scaling_exponents(results)
+    for family, exponent in exponents.items():
+        print(f"scaling {family}: per-item time ~ n^{exponent:.2f}")
+
+    run = {
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()},
+        "cases": results,
+        "scaling_exponents": exponents,
+    }
+    if args.output_path:
+        with open(args.output_path, 'w') as o_file:
+            json.dump(run, o_file, indent=2)
+            o_file.write("\n")
+
+    if args.update_baseline:
+        thresholds = {"time_ratio": 2.0, "min_seconds": 0.05, "memory_ratio": 1.25, "min_mb": 1.0, "max_scaling_exponent": 1.8}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r') as i_file:
+                thresholds = json.load(i_file).get("thresholds", thresholds)
+        run["thresholds"] = thresholds
+        run["cases"] = {name: {"seconds": result["seconds"], "peak_mb": result["peak_mb"]} for name, result in results.items()}
+        with open(args.baseline, 'w') as o_file:
+            json.dump(run, o_file, indent=2)
+            o_file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update_baseline to create one.")
+        return
+    with open(args.baseline, 'r') as i_file:
+        baseline = json.load(i_file)
+    regressions = compare(results, exponents, baseline)
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
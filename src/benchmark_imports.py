@@ -0,0 +1,71 @@
+'''
+Import cost of the entry points: wall time, peak RSS and whether torch/transformers were
+loaded, each measured in a fresh interpreter (median of --repeats).
+
+python ./src/benchmark_imports.py
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("torch", "transformers", "huggingface_hub")
+DEFAULT_TARGETS = {
+    "utils.ClassAPI": "import utils.ClassAPI",
+    "select_generator(gpt-4o-mini)": "from utils.ClassAPI import select_generator; select_generator('gpt-4o-mini')",
+    "generate": "import generate",
+    "llm_as_judge": "import llm_as_judge",
+    "math_benchmark": "import math_benchmark",
+    "utils.hf_models": "import utils.hf_models",
+}
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+exec({statement!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure import time and memory of the entry points.")
+    parser.add_argument("--targets", type=str, nargs='+', default=list(DEFAULT_TARGETS), choices=list(DEFAULT_TARGETS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output_path", type=str, default=None, help="Optional JSON file for the results.")
+    return parser.parse_args()
+
+def measure(statement: str) -> dict:
+    probe = PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    completed = subprocess.run(
+        [sys.executable, "-c", probe], cwd=os.path.dirname(SRC_DIR), capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [SRC_DIR, os.environ.get("PYTHONPATH")]))}
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main():
+    args = parse_args()
+    results = {}
+    for target in args.targets:
+        runs = [measure(DEFAULT_TARGETS[target]) for _ in range(args.repeats)]
+        results[target] = {
+            "seconds": statistics.median(run["seconds"] for run in runs),
+            "peak_rss_mb": statistics.median(run["peak_rss_mb"] for run in runs),
+            "heavy_modules": runs[-1]["heavy_modules"],
+        }
+        result = results[target]
+        print(f"{target:<32} {result['seconds']:>7.2f}s {result['peak_rss_mb']:>8.0f} MB  "
+              f"heavy: {', '.join(result['heavy_modules']) or '-'}")
+    if args.output_path:
+        with open(args.output_path, 'w') as o_file:
+            json.dump(results, o_file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+'''
+Throughput of batched local generation (LocalBatchScheduler) against the one-prompt-at-a-time
+get_single_completion path, on the same grid prompts with greedy decoding.
+
+python ./src/benchmark_local_batching.py \
+    --model llama \
+    --num_prompts 16 \
+    --step_size 500 \
+    --batch_sizes 4 8 \
+    --max_new_tokens 64
+
+--model_id loads a different checkpoint of the same family (e.g. a small one for CPU runs)
+in place of the model's default weights.
+'''
+import argparse
+import json
+import time
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from utils.ClassAPI import DataProcessor, select_generator
+from utils.hf_models import _MODEL_REGISTRY
+from utils.local_batching import LocalBatchScheduler
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare batched and single-prompt local generation throughput.")
+    parser.add_argument("--model", type=str, default="llama", choices=["gemma", "llama"])
+    parser.add_argument("--model_id", type=str, default=None, help="Checkpoint to load instead of the model's default.")
+    parser.add_argument("--dtype", type=str, default="bfloat16", choices=["bfloat16", "float16", "float32"])
+    parser.add_argument("--dataset_path", type=str, default="./data/cleaned.jsonl")
+    parser.add_argument("--prompt_key", type=str, default="math_prompt")
+    parser.add_argument("--system_prompt", type=str, default="long_math", choices=["math", "long_context", "long_math"])
+    parser.add_argument("--num_prompts", type=int, default=16, help="Grid cells to generate, taken in grid order.")
+    parser.add_argument("--step_size", type=int, default=500)
+    parser.add_argument("--batch_sizes", type=int, nargs='+', default=[4, 8])
+    parser.add_argument("--local_batch_tokens", type=int, default=None,
+                        help="Token budget of a batch (derived from the model's free GPU memory when omitted).")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--output_path", type=str, default=None, help="Optional JSON file for the results.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    generator = select_generator(args.model)
+    if args.model_id:
+        # Pre-seed the shared registry so connect() reuses these weights
+        model = AutoModelForCausalLM.from_pretrained(args.model_id, torch_dtype=getattr(torch, args.dtype))
+        _MODEL_REGISTRY[generator.model_id] = (AutoTokenizer.from_pretrained(args.model_id), model.eval())
+    generator.connect()
+    # Greedy decoding so both paths produce comparable completions
+    generator.gen_overrides = {"max_new_tokens": args.max_new_tokens, "do_sample": False, "temperature": None, "top_p": None}
+
+    data_processor = DataProcessor()
+    data_processor.load_benign_questions("data/benign_questions.jsonl")
+    data_processor.load_malicious_questions(path_to_jsonl=args.dataset_path, num_questions='all', prompt_key=args.prompt_key)
+    system_prompt = json.load(open("resources/system_prompts.json"))[args.system_prompt]
+    cells = []
+    for cell in data_processor.iter_cells(args.step_size):
+        if len(cells) == args.num_prompts:
+            break
+        cells.append(cell)
+    prompts = [data_processor.generate_prompt(insert_position, mal_question) for _, insert_position, mal_question in cells]
+
+    results = {"model": args.model, "model_id": args.model_id or generator.model_id, "num_prompts": len(prompts)}
+    start = time.perf_counter()
+    single = [
+        generator.get_single_completion(args.model, prompt, data_processor.malicious_uuid, system_prompt)
+        for prompt in prompts
+        ]
+    seconds = time.perf_counter() - start
+    results["single"] = {"seconds": seconds, "prompts_per_second": len(prompts) / seconds}
+    print(f"single       {seconds:>8.2f}s {len(prompts) / seconds:>8.2f} prompts/s")
+
+    def encode(i):
+        return generator.encode_prompt(prompts[i], data_processor.malicious_uuid, system_prompt)
+
+    for batch_size in args.batch_sizes:
+        scheduler = LocalBatchScheduler(generator, batch_size, args.local_batch_tokens)
+        start = time.perf_counter()
+        batched = dict((i, output) for i, output, _ in scheduler.run(range(len(prompts)), encode))
+        seconds = time.perf_counter() - start
+        report = scheduler.throughput()
+        report.update({
+            "wall_seconds": seconds,
+            "speedup": results["single"]["seconds"] / seconds,
+            # Padding changes the numerics slightly, so greedy outputs can diverge late in a sequence
+            "matches_single": sum(batched[i] == single[i] for i in range(len(prompts))) / len(prompts),
+        })
+        results[f"batch_{batch_size}"] = report
+        print(f"batch {batch_size:<6} {seconds:>8.2f}s {len(prompts) / seconds:>8.2f} prompts/s "
+              f"{report['generated_tokens_per_second']:>8.1f} tok/s  x{report['speedup']:.2f}  "
+              f"padding {report['padding_ratio']:.0%}  same output {report['matches_single']:.0%}")
+
+    if args.output_path:
+        with open(args.output_path, 'w') as o_file:
+            json.dump(results, o_file, indent=2)
+
+if __name__ == "__main__":
+    main()
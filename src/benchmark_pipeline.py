@@ -0,0 +1,139 @@
+'''
+Offline throughput benchmark: runs generate.py (or the generate+judge pipeline) against the
+mock OpenAI-compatible server for every grid size / concurrency combination and reports
+prompts per second, tail latency and peak memory. Nothing is downloaded: the grids are
+uniform in entries (--step_size), so generate.py records no token offsets and never loads a
+tokenizer, and neither side sets a TPM budget, which would count prompt tokens.
+
+python ./src/benchmark_pipeline.py \
+    --mode pipeline \
+    --num_questions 1 4 16 \
+    --step_size 500 \
+    --concurrency 1 8 \
+    --latency_ms 300 \
+    --error_rate_429 0.02 \
+    --output_path ./data/benchmarks/pipeline_benchmark.json
+'''
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from utils.checkpoint import read_jsonl_rows
+from utils.mock_server import add_mock_server_args, server_from_args
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the generation pipeline against a mock API server.")
+    parser.add_argument("--mode", type=str, default="generate", choices=["generate", "pipeline"],
+                        help="'pipeline' also judges every generation as it arrives.")
+    parser.add_argument("--num_questions", type=int, nargs='+', default=[1, 4], help="Malicious questions per grid.")
+    parser.add_argument("--step_size", type=int, nargs='+', default=[500], help="Insert-position step sizes.")
+    parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 8], help="Requests in flight.")
+    parser.add_argument("--dataset_path", type=str, default="./data/cleaned.jsonl")
+    parser.add_argument("--prompt_key", type=str, default="math_prompt")
+    parser.add_argument("--system_prompt", type=str, default="long_math", choices=["long_context", "long_math"])
+    parser.add_argument("--model", type=str, default="gpt-4o-mini")
+    parser.add_argument("--output_path", type=str, default="./data/benchmarks/pipeline_benchmark.json",
+                        help="Where the benchmark results are written.")
+    add_mock_server_args(parser)
+    return parser.parse_args()
+
+def run_config(mode: str, argv: list, results: multiprocessing.Queue):
+    # Runs in a fresh process so peak RSS belongs to this configuration alone
+    if mode == "pipeline":
+        import pipeline as module
+    else:
+        import generate as module
+    start = time.perf_counter()
+    module.main(module.build_arg_parser().parse_args(argv))
+    results.put({
+        "wall_seconds": time.perf_counter() - start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+def latency_report(telemetry_path: str) -> dict:
+    if not os.path.exists(telemetry_path):
+        return {}
+    with open(telemetry_path, 'r') as i_file:
+        summary = json.load(i_file)
+    return {"requests": summary["requests"], "retries": summary["retries"], **summary["latency"]}
+
+def benchmark(args, server, num_questions: int, step_size: int, concurrency: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="lcm_bench_") as workdir:
+        output_path = os.path.join(workdir, f"{args.system_prompt}.jsonl")
+        results_path = os.path.join(workdir, f"{args.system_prompt}_results.jsonl")
+        telemetry_dir = os.path.join(workdir, "telemetry")
+        argv = [
+            "--model", args.model,
+            "--num_questions", str(num_questions),
+            "--dataset_path", args.dataset_path,
+            "--step_size", str(step_size),
+            "--output_path", output_path,
+            "--prompt_key", args.prompt_key,
+            "--system_prompt", args.system_prompt,
+            "--concurrency", str(concurrency),
+            "--telemetry_dir", telemetry_dir,
+        ]
+        if args.mode == "pipeline":
+            argv += ["--results_path", results_path, "--judge_concurrency", str(concurrency)]
+
+        served_before = dict(server.stats)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=run_config, args=(args.mode, argv, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise RuntimeError(f"Benchmark run failed with exit code {process.exitcode}: {argv}")
+        run = results.get()
+
+        prompts = len(read_jsonl_rows(output_path))
+        report = {
+            "mode": args.mode,
+            "num_questions": num_questions,
+            "step_size": step_size,
+            "concurrency": concurrency,
+            "prompts": prompts,
+            "prompts_per_second": prompts / run["wall_seconds"] if run["wall_seconds"] else None,
+            **run,
+            "generation_latency": latency_report(os.path.join(telemetry_dir, f"{args.system_prompt}.telemetry.json")),
+            "server": {key: server.stats[key] - served_before[key] for key in server.stats},
+        }
+        if args.mode == "pipeline":
+            report["judged"] = len(read_jsonl_rows(results_path))
+            report["judge_latency"] = latency_report(
+                os.path.join(telemetry_dir, f"{args.system_prompt}_results.telemetry.json")
+                )
+        return report
+
+def main():
+    args = parse_args()
+    os.makedirs(os.path.dirname(args.output_path) or ".", exist_ok=True)
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+    reports = []
+    with server_from_args(args) as server:
+        # Child processes inherit the environment, so their OpenAI clients talk to the mock server
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        print(f"Mock server at {server.base_url}")
+        for num_questions, step_size, concurrency in itertools.product(args.num_questions, args.step_size, args.concurrency):
+            report = benchmark(args, server, num_questions, step_size, concurrency)
+            reports.append(report)
+            latency = report["generation_latency"]
+            print(
+                f"questions={num_questions} step={step_size} concurrency={concurrency}: "
+                f"{report['prompts']} prompts in {report['wall_seconds']:.2f}s "
+                f"({report['prompts_per_second']:.2f}/s), "
+                f"p50={latency.get('p50', float('nan')):.3f}s p99={latency.get('p99', float('nan')):.3f}s, "
+                f"peak RSS {report['peak_rss_mb']:.0f} MB"
+            )
+
+    with open(args.output_path, 'w') as o_file:
+        json.dump({"config": vars(args), "runs": reports}, o_file, indent=2)
+    print(f"Results written to {args.output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -10,103 +10,356 @@ python ./src/generate.py \
     --system_prompt "long_math"
 '''
 import json
-from utils.ClassAPI import DataProcessor, select_generator
-from utils.logging import gen_logger
+from utils.ClassAPI import DataProcessor, Gpt, select_generator
+from utils.batch import (
+    add_batch_args, backend_from_args, batch_paths, batch_request, load_batch_state,
+    make_custom_id, run_batch, write_batch_files
+)
+from utils.checkpoint import CheckpointWriter
+from utils.concurrency import RateLimiter, run_ordered
+from utils.local_batching import LocalBatchScheduler, add_local_batching_args
+from utils.logging import get_logger
+from utils.response_cache import add_cache_args, cache_from_args
+from utils.sharding import in_shard, parse_shard, shard_output_path, shard_size, write_manifest
+from utils.storage import add_storage_args, export_columnar
+from utils.telemetry import add_telemetry_args, telemetry_from_args
 import argparse
+import contextlib
 import os
+import time
+from typing import Union
+import uuid
 
-def parse_args():
+logger = get_logger("logs/generate.log")
+
+def build_arg_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Generate text using language models.")
     parser.add_argument("--model", type=str, required=True, help="Model name to use for generation.")
     parser.add_argument("--all_questions", type=str, default='false', choices=['true','false'], help="Use all malicious questions (set to true if present).")
     parser.add_argument("--num_questions", type=int, default=1, help="Number of malicious questions to use ('all' or an integer).")
     parser.add_argument("--dataset_path", type=str, required=True, help="Path to file containing malicious questions.")
     parser.add_argument("--step_size", type=int, default=1, help="Step size for generating prompts.")
+    parser.add_argument("--token_step", type=int, default=None,
+                        help="Insert the malicious question every N tokens of context instead of every step_size entries.")
+    parser.add_argument("--depth_percent_step", type=float, default=None,
+                        help="Insert the malicious question every N percent of the context's token depth.")
     parser.add_argument("--output_path", type=str, help="Output directory for generated text.")
     parser.add_argument("--prompt_key", type=str, default="question", help="Key to use for prompt generation")
     parser.add_argument("--system_prompt", type=str, default="math", choices=["math", "long_context", "long_math"],
                         help="System prompt to use for generation")
-    return parser.parse_args()
+    parser.add_argument("--concurrency", type=int, default=1, help="Maximum number of requests in flight at once (API models only; local models run one prompt at a time).")
+    parser.add_argument("--rpm", type=float, default=None, help="Requests-per-minute budget (API models only).")
+    parser.add_argument("--tpm", type=float, default=None, help="Tokens-per-minute budget, charged by prompt token count (API models only).")
+    parser.add_argument("--prefix_cache_mb", type=int, default=0,
+                        help="Memory budget for reusing the shared benign-prefix KV cache (local models only, 0 disables).")
+    parser.add_argument("--warm_up", action="store_true", help="Run a tiny generation after loading a local model.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep completed rows in output_path and only generate missing or failed cells.")
+    parser.add_argument("--shard", type=parse_shard, default=None,
+                        help="Only run grid cells with idx %% N == i (written to a per-shard file); merge with merge_shards.py.")
+    parser.add_argument("--malicious_uuid", type=str, default=None,
+                        help="Key of the inserted question; pass the same one to every shard. When omitted it is "
+                             "reused from --resume rows, derived from the run's inputs with --cache_path, or random.")
+    add_cache_args(parser)
+    add_batch_args(parser)
+    add_local_batching_args(parser)
+    add_telemetry_args(parser)
+    add_storage_args(parser)
+    return parser
+
+def parse_args():
+    return build_arg_parser().parse_args()
+
+def shard_path(path: str, args) -> str:
+    # Per-shard file when --shard is set, so shards never share an output file
+    return shard_output_path(path, args.shard) if args.shard else path
+
+def cell_key(row: dict, model: str, system_prompt: str) -> tuple:
+    # Rows written before model/system_prompt were recorded belong to the current run
+    return (row["mal_q_id"], row["insert_position"], row.get("model", model), row.get("system_prompt", system_prompt))
 
-def main():
-    gen_logger(init=True)
+def run_malicious_uuid(args, resumed_rows) -> Union[str, None]:
+    """
+    Malicious UUID for this run when --malicious_uuid is not given: the one the resumed rows
+    were built with, or, with a response cache, one derived from the run's inputs so a rerun
+    builds the same prompts and hits the cache.
+
+    Returns:
+        The UUID, or None to keep DataProcessor's random one.
+    """
+    if args.malicious_uuid:
+        return args.malicious_uuid
+    for row in resumed_rows:
+        if row.get("mal_question"):
+            return next(iter(row["mal_question"]))
+    if args.cache_path:
+        run_inputs = json.dumps([args.dataset_path, args.prompt_key, args.model, args.system_prompt])
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, run_inputs))
+    return None
+
+def run_generation_batch(args, generator, data_processor, jobs, system_prompt, requests_path, state_path, batch_state):
+    """
+    Generate every pending cell through the batch endpoint and yield `(job, output)` pairs
+    in job order. Cells missing from the batch output come back as None.
+    """
+    if not isinstance(generator, Gpt):
+        raise ValueError("--batch is only supported for API models.")
+    parts = []
+    if not batch_state:
+        def requests():
+            for idx, (mal_q_id, insert_position, mal_question) in jobs:
+                prompt = data_processor.generate_prompt(insert_position, mal_question)
+                messages, gen_params = generator.build_messages(
+                    args.model, prompt, data_processor.malicious_uuid, system_prompt
+                    )
+                yield batch_request(make_custom_id(mal_q_id, insert_position), args.model, messages, gen_params)
+        parts = write_batch_files(requests_path, requests(), args.batch_max_mb, args.batch_max_tokens)
+        logger.info(f"Wrote {sum(part['requests'] for part in parts)} batch requests to {len(parts)} file(s)")
+
+    results = run_batch(
+        backend_from_args(args, getattr(generator, "client", None)),
+        parts,
+        state_path,
+        max_tokens=args.batch_max_tokens,
+        poll_interval=args.poll_interval,
+        metadata={"malicious_uuid": data_processor.malicious_uuid},
+        log=logger.info
+        )
+    for job in jobs:
+        idx, (mal_q_id, insert_position, mal_question) = job
+        yield job, results.get(make_custom_id(mal_q_id, insert_position))
+
+def main(args=None, on_row=None):
+    """
+    Run the generation grid. `on_row`, if given, is called with every row right after it is
+    written, so callers such as pipeline.py can consume generations as they complete.
+    """
+    logger.info("New run", event="run_start")
     # PARSE ARGS
-    args = parse_args()
-    gen_logger("Arguments parsed successfully", "INFO")
-    gen_logger(
+    args = args or parse_args()
+    logger.info("Arguments parsed successfully")
+    logger.info(
         f"Model: {args.model}, All Questions: {args.all_questions}, Number of Questions: {args.num_questions}"
-        f"Step Size: {args.step_size}, dataset_path: {args.dataset_path}, Output Path: {args.output_path}", "INFO")
+        f"Step Size: {args.step_size}, dataset_path: {args.dataset_path}, Output Path: {args.output_path}")
 
     if args.all_questions == 'true':
         args.num_questions = 'all'
         
-    gen_logger(f"Number of questions to use: {args.num_questions}", "INFO")
+    logger.info(f"Number of questions to use: {args.num_questions}")
 
     # ENSURE OUTPUT DIRECTORY EXISTS
     os.makedirs(os.path.dirname(args.output_path), exist_ok=True)
+    output_path = shard_path(args.output_path, args)
+    if args.shard:
+        logger.info(f"Running shard {args.shard[0]}/{args.shard[1]} into {output_path}")
+
+    # Checked before the output file is touched: one resident local model is not thread-safe
+    generator = select_generator(args.model)
+    if generator.is_local and args.concurrency > 1:
+        raise ValueError("--concurrency > 1 is only supported for API models; use --local_batch_size for local models.")
 
-    # CLEAR OUTPUT FILE
-    with open(args.output_path, 'w') as f:
-        f.write("")
-    gen_logger(f"Cleared existing output file at {args.output_path}", "INFO")       
+    # OPEN CHECKPOINT (cleared unless resuming)
+    writer = CheckpointWriter(
+        output_path,
+        key_fn=lambda row: cell_key(row, args.model, args.system_prompt),
+        resume=args.resume,
+        is_complete=lambda row: row.get("output") is not None
+        )
+    if args.resume:
+        logger.info(f"Resuming {output_path} with {len(writer.completed)} completed rows")
+    else:
+        logger.info(f"Cleared existing output file at {output_path}")
     
     # DATA SETUP
     data_processor = DataProcessor()
-    gen_logger("Loading benign questions...", "INFO")
+    malicious_uuid = run_malicious_uuid(args, writer.completed.values())
+    if malicious_uuid:
+        data_processor.malicious_uuid = malicious_uuid
+    if args.batch:
+        # Reattach to an unfinished batch with the malicious UUID its prompts were built with
+        requests_path, state_path = batch_paths(args.batch_dir, output_path)
+        batch_state = load_batch_state(state_path)
+        data_processor.malicious_uuid = batch_state.get("malicious_uuid", data_processor.malicious_uuid)
+    logger.info("Loading benign questions...")
     data_processor.load_benign_questions("data/benign_questions.jsonl")
-    gen_logger("Loading malicious questions...", "INFO")
+    logger.info("Loading malicious questions...")
     data_processor.load_malicious_questions(
         path_to_jsonl=args.dataset_path, 
         num_questions=args.num_questions,
         prompt_key=args.prompt_key
         )
-    data_processor.generate_list_of_prompts(args.step_size)
-    gen_logger(f"Generated list of prompts with length: {len(data_processor.prompt_list)}", "INFO")
+    # Insert positions: uniform in entries (step_size) or in token depth
+    positions = None
+    # Token offsets need the tokenizer, so they are only recorded for token-depth grids
+    token_positions = bool(args.token_step or args.depth_percent_step)
+    if token_positions:
+        positions = data_processor.token_depth_positions(args.token_step, args.depth_percent_step)
+        logger.info(f"Token-depth positions ({data_processor.total_tokens()} benign tokens): {positions}")
+
+    # Prompts are built lazily per cell, so memory is bounded by the in-flight window
+    grid_size = data_processor.count_prompts(args.step_size, positions)
+    logger.info(f"Prompt grid size: {grid_size}")
+    if args.shard:
+        write_manifest(output_path, {
+            "shard": list(args.shard),
+            "grid_size": grid_size,
+            "shard_size": shard_size(grid_size, args.shard),
+            "model": args.model,
+            "system_prompt": args.system_prompt,
+            "dataset_path": args.dataset_path,
+            "num_questions": args.num_questions,
+            "step_size": args.step_size,
+            "positions": positions,
+            "malicious_uuid": data_processor.malicious_uuid,
+            })
 
     # GENERATE TEXT
-    gen_logger("Selecting and connecting to generator...", "INFO")
-    generator = select_generator(args.model)
-    generator.connect()
-    gen_logger("Generator connected successfully", "INFO")
+    logger.info("Connecting to generator...")
+    if args.warm_up and generator.is_local:
+        generator.warm_up_on_connect = True
+    if args.prefix_cache_mb and generator.is_local:
+        generator.set_prefix_cache(args.prefix_cache_mb)
+    response_cache = cache_from_args(args)
+    if response_cache is not None and hasattr(generator, "response_cache"):
+        generator.response_cache = response_cache
+    telemetry = telemetry_from_args(args, output_path)
+    if hasattr(generator, "telemetry"):
+        generator.telemetry = telemetry
+    # The local batch stand-in never talks to the API
+    if not (args.batch and args.batch_backend == "local"):
+        generator.connect()
+    if generator.is_local:
+        logger.info(f"Model resident: {json.dumps(generator.memory_report())}")
+    logger.info("Generator connected successfully")
 
     system_prompt_config = json.load(open("resources/system_prompts.json"))
     system_prompt = system_prompt_config[args.system_prompt]
     
-    # Iterate over prompts and generate completions
-    for idx, (prompt, mal_q_id, insert_position, mal_question) in enumerate(data_processor.prompt_list):
-        # Track the position of the malicious question in the benign list
-        gen_logger(f"idx: {idx}\tmal_q_id: {mal_q_id}\tinsert_position: {insert_position}", "INFO")
-        
+    # Share one limiter across worker threads so RPM/TPM budgets are global to the run
+    if hasattr(generator, "rate_limiter"):
+        generator.rate_limiter = RateLimiter(
+            max_concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm
+            )
+
+    latencies = {}
+    token_usage = {}
+
+    def complete(job):
+        idx, (mal_q_id, insert_position, mal_question) = job
+        prompt = data_processor.generate_prompt(insert_position, mal_question)
+
         # Generate completion using the model
+        start = time.perf_counter()
+        status = "error"
         try:
-            output = generator.get_single_completion(
-                model=args.model, 
-                user_prompt=prompt, 
-                malicious_uuid=data_processor.malicious_uuid,
-                system_prompt=system_prompt
-                )
+            with telemetry.labels(insert_position=insert_position) if telemetry else contextlib.nullcontext():
+                output = generator.get_single_completion(
+                    model=args.model, 
+                    user_prompt=prompt, 
+                    malicious_uuid=data_processor.malicious_uuid,
+                    system_prompt=system_prompt
+                    )
+            status = "ok" if output is not None else "error"
+            return output
         except Exception as e:
-            gen_logger(f"Error for prompt #{idx}: {str(e)}", "ERROR")
+            logger.error(f"Error for prompt #{idx}: {str(e)}", idx=idx, mal_q_id=mal_q_id, insert_position=insert_position)
             raise e
+        finally:
+            latencies[idx] = time.perf_counter() - start
+            if hasattr(generator, "last_usage"):
+                token_usage[idx] = generator.last_usage()
+            # API clients record their own calls with token usage; local models are timed here
+            if telemetry is not None and not hasattr(generator, "telemetry"):
+                telemetry.record(args.model, latencies[idx], status=status, insert_position=insert_position)
 
+    def complete_batched(jobs):
+        # Jobs come back grouped by prompt length; finalize() restores idx order in the output file
+        def encode(job):
+            idx, (mal_q_id, insert_position, mal_question) = job
+            prompt = data_processor.generate_prompt(insert_position, mal_question)
+            return generator.encode_prompt(prompt, data_processor.malicious_uuid, system_prompt)
+
+        for job, output, latency in scheduler.run(jobs, encode):
+            idx, (mal_q_id, insert_position, mal_question) = job
+            latencies[idx] = latency
+            if telemetry is not None:
+                telemetry.record(
+                    args.model, latency, status="ok" if output is not None else "error", insert_position=insert_position
+                    )
+            yield job, output
+
+    # Completions run concurrently but are yielded (and written) in idx order
+    jobs = [
+        (idx, cell) for idx, cell in enumerate(data_processor.iter_cells(args.step_size, positions))
+        if (args.shard is None or in_shard(idx, args.shard))
+        and not writer.is_done((cell[0], cell[1], args.model, args.system_prompt))
+        ]
+    if getattr(generator, "prefix_cache", None) is not None:
+        # Walk the grid position by position so every question at a depth reuses one prefix;
+        # finalize() restores idx order in the output file
+        jobs.sort(key=lambda job: job[1][1])
+    scheduler = None
+    if args.batch:
+        completed = run_generation_batch(
+            args, generator, data_processor, jobs, system_prompt, requests_path, state_path, batch_state
+            )
+    elif generator.is_local and args.local_batch_size > 1:
+        if getattr(generator, "prefix_cache", None) is not None:
+            logger.warning("The prefix cache is not used for batched local generation")
+        scheduler = LocalBatchScheduler(generator, args.local_batch_size, args.local_batch_tokens)
+        completed = complete_batched(jobs)
+    else:
+        completed = run_ordered(jobs, complete, max_workers=args.concurrency)
+    for (idx, (mal_q_id, insert_position, mal_question)), output in completed:
         # Build the JSON output structure        
         json_output = {
             "idx": idx + 1,
             "mal_q_id": mal_q_id,
             "insert_position": insert_position,
+            "token_offset": data_processor.token_offset(insert_position) if token_positions else None,
             "output": output,
-            "mal_question": mal_question
+            "mal_question": mal_question,
+            "model": args.model,
+            "system_prompt": args.system_prompt
         }
 
         # Write the output to a JSONL
         try:
-            with open(args.output_path, 'a') as o_file:
-                o_file.write(json.dumps(json_output) + "\n")
-            gen_logger(f"Written output for prompt {idx} to {args.output_path}", "INFO")
+            writer.write(json_output)
+            # Track the position of the malicious question in the benign list
+            logger.info(
+                "Generated",
+                idx=idx,
+                mal_q_id=mal_q_id,
+                insert_position=insert_position,
+                latency=latencies.pop(idx, None),
+                token_offset=json_output["token_offset"],
+                tokens=token_usage.pop(idx, None),
+                output_chars=len(output) if output is not None else None
+                )
+            if on_row is not None:
+                on_row(json_output)
         except IOError as e:
-            gen_logger(f"Error writing output for prompt {idx} to file: {str(e)}", "ERROR")
+            logger.error(f"Error writing output for prompt {idx} to file: {str(e)}", idx=idx)
 
-    gen_logger("Run completed successfully", "INFO")
+    # Resumed rows were appended out of order; rewrite the file sorted by idx
+    writer.finalize(sort_key=lambda row: row["idx"])
+    if args.storage == "parquet":
+        logger.info(f"Columnar copy written to {export_columnar(output_path)}")
+    if scheduler is not None:
+        logger.info(f"Local batching: {json.dumps(scheduler.throughput())}")
+    if generator.is_local:
+        logger.info(f"Final memory report: {json.dumps(generator.memory_report())}")
+        generator.unload()
+    if response_cache is not None:
+        logger.info(f"Response cache: {json.dumps(response_cache.stats())}")
+        response_cache.close()
+    if telemetry is not None:
+        json_path, prom_path = telemetry.write(args.telemetry_dir)
+        logger.info(f"Telemetry written to {json_path} and {prom_path}")
+    logger.info("Run completed successfully", event="run_end")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
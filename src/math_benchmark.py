@@ -7,6 +7,7 @@ python ./src/math_benchmarking.py
 """
 # IMPORTS
 from utils.ClassAPI import api_config
+from utils.response_cache import CacheMiss, add_cache_args, cache_from_args
 import json
 import pandas as pd
 
@@ -14,6 +15,7 @@ import argparse
 def parse_args():
     parser = argparse.ArgumentParser(description="Generate text using language models.")
     parser.add_argument("--output_path", type=str, required=True, help="Model name to use for generation.")
+    add_cache_args(parser)
     return parser.parse_args()
 
 def main():
@@ -25,15 +27,16 @@ def main():
     system_prompt_config = json.load(open("resources/system_prompts.json"))
     system_prompt = system_prompt_config["math"]
   
-    # API CONFIG
-    client = api_config()
+    # API CONFIG (not needed when replaying cached responses)
+    cache = cache_from_args(args)
+    client = None if cache is not None and cache.replay else api_config()
+    model = "gpt-4o-mini"
+    gen_params = {"temperature": 0.1, "max_tokens": 1024, "top_p": 0.1}
 
     # PROMPTING
 
     for i, row in df.iterrows():
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
+        messages = [
             {
                 "role": "system",
                 "content": system_prompt
@@ -42,12 +45,24 @@ def main():
                 "role": "user",
                 "content": row["math_prompt"]
             }
-            ],
-            temperature=0.1,
-            max_tokens=1024,
-            top_p=0.1
-        )
-        resp = response.choices[0].message.content.strip()
+        ]
+
+        def create():
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                **gen_params
+            )
+            return response.choices[0].message.content.strip()
+
+        if cache is None:
+            resp = create()
+        else:
+            try:
+                resp = cache.get_or_create(model, messages, gen_params, create)
+            except CacheMiss:
+                print(f"No cached response for {row['id']} in replay mode")
+                resp = None
 
         with open(args.output_path, 'a') as f:
             f.write(
@@ -57,6 +72,10 @@ def main():
                         "id": row["id"], 
                         "output": resp, 
                         "prompt": row["math_prompt"]}) + "\n")
-        
+
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+        cache.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
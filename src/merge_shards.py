@@ -0,0 +1,107 @@
+'''
+Merge the per-shard files written by `generate.py --shard i/N` into the canonical output file,
+after checking that every grid cell is present exactly once and completed.
+
+python ./src/merge_shards.py \
+    --output_path ./data/generations/long_math.jsonl \
+    --num_shards 4
+'''
+import argparse
+import glob
+import os
+import re
+import sys
+from utils.checkpoint import atomic_write_jsonl, read_jsonl_rows
+from utils.sharding import manifest_path, read_manifest, shard_paths
+
+# Manifest fields that must agree across shards of the same run; shards built with different
+# malicious UUIDs (no shared --malicious_uuid) have incomparable prompts
+RUN_FIELDS = (
+    "grid_size", "model", "system_prompt", "dataset_path", "num_questions", "step_size", "positions", "malicious_uuid"
+    )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validate and merge sharded generation outputs.")
+    parser.add_argument("--output_path", type=str, required=True,
+                        help="Canonical output file; shards are read from <stem>.shard-i-of-N<ext> next to it.")
+    parser.add_argument("--num_shards", type=int, default=None, help="Number of shards (detected from the files if omitted).")
+    parser.add_argument("--allow_incomplete", action="store_true",
+                        help="Write the merged file even if cells are missing or failed.")
+    return parser.parse_args()
+
+def detect_num_shards(output_path: str) -> int:
+    stem, ext = os.path.splitext(output_path)
+    counts = set()
+    for path in glob.glob(f"{glob.escape(stem)}.shard-*-of-*{ext}"):
+        match = re.search(r"\.shard-\d+-of-(\d+)" + re.escape(ext) + "$", path)
+        if match:
+            counts.add(int(match.group(1)))
+    if len(counts) != 1:
+        raise ValueError(f"Could not detect the shard count for {output_path} (found {sorted(counts) or 'no shards'})")
+    return counts.pop()
+
+def merge_shards(output_path: str, num_shards: int, allow_incomplete: bool = False) -> dict:
+    """
+    Returns:
+        dict: Counts of the merge; raises ValueError listing every problem unless allow_incomplete.
+    """
+    problems = []
+    paths = shard_paths(output_path, num_shards)
+    manifests = {}
+    for index, path in enumerate(paths):
+        if not os.path.exists(path) or not os.path.exists(manifest_path(path)):
+            problems.append(f"shard {index}/{num_shards}: missing {path} or its manifest")
+            continue
+        manifests[index] = read_manifest(path)
+
+    if not manifests:
+        raise ValueError("\n".join(problems))
+    reference = manifests[min(manifests)]
+    for index, manifest in manifests.items():
+        for field in RUN_FIELDS:
+            if manifest.get(field) != reference.get(field):
+                problems.append(f"shard {index}/{num_shards}: {field}={manifest.get(field)!r} differs from {reference.get(field)!r}")
+        if manifest["shard"] != [index, num_shards]:
+            problems.append(f"shard {index}/{num_shards}: manifest says {manifest['shard']}")
+    grid_size = reference["grid_size"]
+
+    rows = {}
+    failed = 0
+    for index in manifests:
+        for row in read_jsonl_rows(paths[index]):
+            # idx in the output is 1-based
+            if not 1 <= row["idx"] <= grid_size or (row["idx"] - 1) % num_shards != index:
+                problems.append(f"shard {index}/{num_shards}: row idx {row['idx']} does not belong to this shard")
+                continue
+            if row.get("output") is None:
+                failed += 1
+                continue
+            rows[row["idx"]] = row
+
+    missing = [idx for idx in range(1, grid_size + 1) if idx not in rows]
+    if missing:
+        rerun = sorted({(idx - 1) % num_shards for idx in missing})
+        problems.append(
+            f"{len(missing)} of {grid_size} cells missing or failed (first idx: {missing[:10]}); "
+            f"rerun shards {rerun} with --resume"
+        )
+    if problems and not allow_incomplete:
+        raise ValueError("\n".join(problems))
+
+    atomic_write_jsonl(output_path, (rows[idx] for idx in sorted(rows)))
+    return {"grid_size": grid_size, "merged": len(rows), "missing": len(missing), "failed_rows": failed, "problems": problems}
+
+def main():
+    args = parse_args()
+    try:
+        num_shards = args.num_shards or detect_num_shards(args.output_path)
+        report = merge_shards(args.output_path, num_shards, args.allow_incomplete)
+    except ValueError as e:
+        print(f"Not merging {args.output_path}:\n{e}")
+        sys.exit(1)
+    for problem in report["problems"]:
+        print(f"Warning: {problem}")
+    print(f"Merged {report['merged']}/{report['grid_size']} cells from {num_shards} shards into {args.output_path}")
+
+if __name__ == "__main__":
+    main()
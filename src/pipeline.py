@@ -0,0 +1,149 @@
+'''
+python ./src/pipeline.py \
+    --model gpt-4o-mini \
+    --all_questions true \
+    --dataset_path ./data/cleaned.jsonl \
+    --step_size 500 \
+    --prompt_key "math_prompt" \
+    --system_prompt "long_math" \
+    --output_path ./data/generations/long_math.jsonl \
+    --results_path ./data/results/long_math_results.jsonl
+'''
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import queue
+import threading
+from types import SimpleNamespace
+import pandas as pd
+import generate
+from llm_as_judge import judge_generation, judge_key, load_judge_config, log_judge_error, result_row
+from utils.ClassAPI import Gpt
+from utils.checkpoint import CheckpointWriter, read_jsonl_rows
+from utils.concurrency import RateLimiter
+from utils.refusal import RefusalClassifier
+from utils.response_cache import cache_from_args
+from utils.storage import export_columnar
+from utils.telemetry import telemetry_from_args
+
+def build_arg_parser():
+    parser = generate.build_arg_parser()
+    parser.description = "Generate completions and judge them as they arrive."
+    parser.add_argument("--results_path", type=str, required=True, help="Where judge verdicts are written.")
+    parser.add_argument("--judge_concurrency", type=int, default=8, help="Maximum number of judge requests in flight.")
+    parser.add_argument("--queue_size", type=int, default=64,
+                        help="Generations buffered between generator and judge before generation blocks.")
+    parser.add_argument("--local_tier", action="store_true",
+                        help="Decide obvious canned refusals locally before calling the LLM judge.")
+    return parser
+
+def parse_args():
+    return build_arg_parser().parse_args()
+
+def main(args=None):
+    """
+    Run generate.main in a producer thread and judge its rows as they are written. Each row
+    taken off the queue gets its own judge future and its verdict is written as soon as it
+    completes; finalize restores generation order at the end.
+    """
+    args = args or parse_args()
+
+    # Judge side: same config, client and checkpointing as llm_as_judge.py
+    config = load_judge_config(args.output_path)
+    judge = Gpt(
+        rate_limiter=RateLimiter(max_concurrency=args.judge_concurrency),
+        response_cache=cache_from_args(args),
+        telemetry=telemetry_from_args(args, generate.shard_path(args.results_path, args))
+        )
+    judge.connect()
+    results = CheckpointWriter(
+        generate.shard_path(args.results_path, args),
+        key_fn=judge_key,
+        resume=args.resume,
+        is_complete=lambda row: row.get('response') is not None
+        )
+    classifier = RefusalClassifier() if args.local_tier else None
+
+    # Generations from an earlier run that were never judged go through first
+    backlog = []
+    if args.resume:
+        backlog = [
+            row for row in read_jsonl_rows(generate.shard_path(args.output_path, args)) if row.get("output") is not None
+            ]
+
+    # Bounded queue: generation blocks when the judge falls behind
+    generations = queue.Queue(maxsize=args.queue_size)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for row in backlog:
+                generations.put(row)
+            generate.main(args, on_row=generations.put)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            generations.put(done)
+
+    producer = threading.Thread(target=produce, name="generate", daemon=True)
+    producer.start()
+
+    def consume():
+        while True:
+            row = generations.get()
+            if row is done:
+                return
+            if row.get("output") is None or results.is_done(judge_key(row)):
+                continue
+            yield SimpleNamespace(
+                idx=row["idx"], mal_q_id=row["mal_q_id"], insert_position=row["insert_position"],
+                generation=row["output"], model=row.get("model")
+                )
+
+    def process(row):
+        if classifier is not None:
+            verdict = classifier.classify(pd.Series([row.generation], dtype=object)).iloc[0]
+            if verdict is not None:
+                return verdict, 'local'
+        try:
+            return judge_generation(judge, config, row.generation, row.insert_position), 'llm'
+        except Exception as e:
+            return None, str(e)
+
+    # At most 2 x --judge_concurrency rows in flight, so a slow judge still fills the queue
+    # and blocks generation
+    in_flight = threading.BoundedSemaphore(2 * args.judge_concurrency)
+
+    def write_verdict(row, future):
+        try:
+            resp, decided_by = future.result()
+            if resp is None:
+                log_judge_error(row, decided_by or "no verdict after retries")
+            else:
+                results.write(result_row(row, resp, decided_by))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            in_flight.release()
+
+    # Verdicts stream into the results file in completion order while generation is still running
+    with ThreadPoolExecutor(max_workers=args.judge_concurrency) as executor:
+        for row in consume():
+            in_flight.acquire()
+            executor.submit(process, row).add_done_callback(functools.partial(write_verdict, row))
+
+    producer.join()
+    # Same order as the generations file, which is what llm_as_judge.py produces from it;
+    # rows from before idx was recorded go last
+    results.finalize(sort_key=lambda row: row.get('idx', float('inf')))
+    if args.storage == "parquet":
+        export_columnar(results.path)
+    if judge.response_cache is not None:
+        judge.response_cache.close()
+    if judge.telemetry is not None:
+        judge.telemetry.write(args.telemetry_dir)
+    if errors:
+        raise errors[0]
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,12 @@ Created on 10/15/2024
 @author: Dan
 python ./src/prepare_data.py
 """
-from utils.etc import token_counter
+from utils.etc import TokenCounter
 import pandas as pd
+import bisect
+import itertools
 import json
+import os
 import uuid
 import argparse
 
@@ -14,7 +17,9 @@ def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_file_path", type=str, default='./data/original/list_of_questions.json')
     parser.add_argument("--output_file_path", type=str, default='./data/benign_questions.jsonl')
-    parser.add_argument("--max_tokens", type=int, default=128000, help="Maximum token length for output file")
+    parser.add_argument("--max_tokens", type=int, nargs='+', default=[128000],
+                        help="Maximum token length for output file. Several values (e.g. 8000 32000 128000 1000000) "
+                             "write one file per budget, suffixed with the budget.")
     return parser.parse_args()
 
 def write_to_jsonl(file_path, data_generator):
@@ -23,6 +28,43 @@ def write_to_jsonl(file_path, data_generator):
         for record in data_generator:
             file.write(json.dumps(record) + '\n')
 
+def records_within_budget(record_tokens, max_tokens):
+    """
+    Number of records emitted when cycling over records with the given token counts
+    until the next record would exceed max_tokens.
+    """
+    cycle_tokens = sum(record_tokens)
+    if cycle_tokens == 0:
+        raise ValueError("Records have no tokens; the budget can never be reached.")
+    full_cycles = max(max_tokens, 0) // cycle_tokens
+    cumulative = list(itertools.accumulate(record_tokens))
+    remainder = max_tokens - full_cycles * cycle_tokens
+    return full_cycles * len(record_tokens) + bisect.bisect_right(cumulative, remainder)
+
+def budget_output_path(output_file_path, max_tokens, n_budgets):
+    if n_budgets == 1:
+        return output_file_path
+    stem, ext = os.path.splitext(output_file_path)
+    return f"{stem}_{max_tokens}{ext}"
+
+def write_budget_files(record_lines, n_records, output_file_path):
+    """
+    Cycle over record_lines once, writing the first n_records[budget] lines to each budget's file.
+    """
+    files = {
+        budget: open(budget_output_path(output_file_path, budget, len(n_records)), 'w')
+        for budget in n_records
+    }
+    try:
+        for index in range(max(n_records.values())):
+            line = record_lines[index % len(record_lines)] + '\n'
+            for budget, o_file in files.items():
+                if index < n_records[budget]:
+                    o_file.write(line)
+    finally:
+        for o_file in files.values():
+            o_file.close()
+
 def main():
     args = parse_args()
     
@@ -36,28 +78,19 @@ def main():
     # Generate UUIDs and prepare for output
     output_list = [{"question": q, "uuid": str(uuid.uuid4())} for q in questions]
 
-    # Iteratively fill data to respect token limit
-    max_tokens = args.max_tokens - longest_math_prompt - 100  # Dynamic buffer
-    current_tokens = 0
-
-    def data_generator():
-        nonlocal current_tokens
-        index = 0
-        while current_tokens < max_tokens:
-            record = output_list[index % len(output_list)]
-            record_text = json.dumps(record)
-            record_tokens = token_counter(record_text)
-
-            if current_tokens + record_tokens > max_tokens:
-                break
-            
-            current_tokens += record_tokens
-            yield record
-            
-            index += 1
-
-    # Write the generated data to file
-    write_to_jsonl(args.output_file_path, data_generator())
+    # Count each unique record once; the output cycles over the same records
+    record_lines = [json.dumps(record) for record in output_list]
+    record_tokens = TokenCounter().count_many(record_lines)
+
+    # Fill every budget in one pass, leaving room for the longest math prompt
+    budgets = sorted(set(args.max_tokens))
+    n_records = {
+        budget: records_within_budget(record_tokens, budget - longest_math_prompt - 100)  # Dynamic buffer
+        for budget in budgets
+    }
+
+    # Write the generated data to every file in one pass
+    write_budget_files(record_lines, n_records, args.output_file_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,161 +1,151 @@
 '''
 Run the results processing script.
+
+Counts are kept incrementally in --state_path, so rerunning only parses rows appended since
+the last run. Watch attack success live while a run is still writing its results:
+
+python ./src/results.py --watch --interval 30
 '''
 
-import json
-from typing import List, Optional
+import argparse
 import pandas as pd
-from scipy import stats  # Importing scipy for statistical analysis
 import seaborn as sns
 import matplotlib.pyplot as plt
 import os  # For creating directories
+from utils.aggregator import ResultsAggregator
+from utils.resampling import add_resampling_args, bootstrap_ci, heterogeneity_test, permutation_tests
 
-
-def safe_string_to_int(s: str) -> Optional[int]:
-    """
-    Safely convert a string to an integer.
-    If conversion fails, returns None and logs the issue.
-    """
-    try:
-        return int(s)
-    except ValueError:
-        print(f"CRAPP!!! Could not convert: {s}")
-        return None
+FILE_PATHS = {
+    "math_results": "./data/results/math_results.jsonl",
+    "long_context_results": "./data/results/long_context_results.jsonl",
+    "long_math_results": "./data/results/long_math_results.jsonl",
+}
 
 
-def accuracy(zero_ones: List[int]) -> float:
-    """
-    Calculate accuracy given a list of binary values (0s and 1s).
-    Accuracy is the sum of the list divided by its length.
-    """
-    if not zero_ones:
-        print("Empty list provided for accuracy calculation.")
-        return 0.0
-    return sum(zero_ones) / len(zero_ones)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Accuracy by insert position and significance tests over the judge results.")
+    parser.add_argument("--state_path", type=str, default="./data/cache/results_aggregate.json",
+                        help="Offsets and running counts; empty to recount everything in memory.")
+    parser.add_argument("--reset", action="store_true", help="Discard the saved state and recount from the start.")
+    parser.add_argument("--watch", action="store_true", help="Keep refreshing and print the report as rows arrive.")
+    parser.add_argument("--interval", type=float, default=10.0, help="Seconds between refreshes with --watch.")
+    add_resampling_args(parser)
+    return parser.parse_args()
 
 
-def process_and_analyze(df: pd.DataFrame, name: str) -> pd.DataFrame:
+def print_confidence_intervals(intervals: pd.DataFrame, confidence: float):
     """
-    Process the DataFrame, print the overall accuracy,
-    and calculate accuracy by 'insert_position' if the column exists.
-    Returns the processed DataFrame.
+    Print the bootstrap CI of every (experiment, model, insert_position).
     """
-    # Convert responses to integers safely
-    df["response"] = df["response"].apply(safe_string_to_int)
-
-    # Drop rows with invalid responses
-    df = df.dropna(subset=["response"])
-
-    # Print overall accuracy
-    print(f"\n{name} Overall accuracy: {accuracy(df['response'].tolist())}")
-
-    # Analyze by insert position if the column exists
-    if "insert_position" in df.columns:
-        by_pos = df.groupby("insert_position")["response"]
-        for pos, responses in by_pos:
-            print(f"Accuracy for position {pos}: {accuracy(responses.tolist())}")
-    
-    return df
+    print(f"\nBOOTSTRAP {confidence:.0%} CONFIDENCE INTERVALS...")
+    for row in intervals.itertuples(index=False):
+        print(f"{row.experiment} ({row.model}) position {row.insert_position}: "
+              f"{row.accuracy:.3f} [{row.ci_low:.3f}, {row.ci_high:.3f}] (n={row.n})")
 
 
-def perform_statistical_test(df: pd.DataFrame):
+def perform_statistical_test(counts: pd.DataFrame, args: argparse.Namespace):
     """
-    Perform a one-way ANOVA test to determine if differences in
-    means across 'insert_position' groups are significant.
+    Permutation test of whether accuracy differs across 'insert_position' groups.
     """
-    if "insert_position" not in df.columns:
-        print("No 'insert_position' column found for statistical testing.")
+    by_position = counts.groupby("insert_position")[["n", "successes"]].sum()
+    by_position = by_position[by_position["n"] > 0]
+    if len(by_position) < 2:
+        print("Need at least two insert positions for statistical testing.")
         return
 
-    # Group responses by insert position
-    groups = [group["response"].tolist() for _, group in df.groupby("insert_position")]
-
-    # Perform ANOVA
-    try:
-        f_stat, p_value = stats.f_oneway(*groups)
-        print(f"\nANOVA Results:")
-        print(f"F-statistic: {f_stat}, p-value: {p_value}")
-        if p_value < 0.05:
-            print("Result: Significant difference detected between groups.")
-        else:
-            print("Result: No significant difference detected between groups.")
-    except Exception as e:
-        print(f"Failed to perform statistical test: {e}")
+    result = heterogeneity_test(
+        by_position["n"], by_position["successes"], resamples=args.resamples, seed=args.seed, workers=args.workers
+        )
+    print(f"\nPermutation test across {len(by_position)} positions ({args.resamples} resamples):")
+    print(f"Chi-square: {result['statistic']}, p-value: {result['p_value']}")
+    if result["p_value"] < 0.05:
+        print("Result: Significant difference detected between groups.")
+    else:
+        print("Result: No significant difference detected between groups.")
 
 
-def save_bar_chart(df: pd.DataFrame, output_dir: str, filename: str):
+def save_bar_chart(intervals: pd.DataFrame, output_dir: str, filename: str):
     """
-    Save a bar chart visualizing accuracy by insert position for the given DataFrame.
+    Save a bar chart visualizing accuracy by insert position, with the bootstrap CIs as error bars.
     """
-    if "insert_position" in df.columns:
-        # Calculate mean accuracy by position
-        accuracy_by_position = df.groupby("insert_position")["response"].mean().reset_index()
-
-        # Create the output directory if it doesn't exist
-        os.makedirs(output_dir, exist_ok=True)
-
-        # Plot the bar chart
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x="insert_position", y="response", data=accuracy_by_position, palette="viridis")
-        plt.title("Accuracy by Insert Position (Long Math Results)", fontsize=14)
-        plt.xlabel("Insert Position", fontsize=12)
-        plt.ylabel("Accuracy", fontsize=12)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-
-        # Save the figure
-        output_path = os.path.join(output_dir, filename)
-        plt.savefig(output_path)
-        plt.close()
-        print(f"Bar chart saved to {output_path}")
+    accuracy_by_position = intervals.rename(columns={"accuracy": "response"})
+
+    # Create the output directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Plot the bar chart
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x="insert_position", y="response", data=accuracy_by_position, palette="viridis")
+    plt.errorbar(
+        range(len(accuracy_by_position)), accuracy_by_position["response"],
+        yerr=[accuracy_by_position["response"] - accuracy_by_position["ci_low"],
+              accuracy_by_position["ci_high"] - accuracy_by_position["response"]],
+        fmt="none", ecolor="black", capsize=4
+        )
+    plt.title("Accuracy by Insert Position (Long Math Results)", fontsize=14)
+    plt.xlabel("Insert Position", fontsize=12)
+    plt.ylabel("Accuracy", fontsize=12)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+
+    # Save the figure
+    output_path = os.path.join(output_dir, filename)
+    plt.savefig(output_path)
+    plt.close()
+    print(f"Bar chart saved to {output_path}")
 
 
 def main():
     """
-    Main function to load data, process it, analyze results, and perform statistical tests.
+    Main function to update the counts, report accuracies with confidence intervals and perform permutation tests.
     """
-    # Load data
-    file_paths = {
-        "math_results": "./data/results/math_results.jsonl",
-        "long_context_results": "./data/results/long_context_results.jsonl",
-        "long_math_results": "./data/results/long_math_results.jsonl",
-    }
-
-    dataframes = {}
-    for key, path in file_paths.items():
-        try:
-            dataframes[key] = pd.read_json(path, lines=True)
-        except Exception as e:
-            print(f"Failed to load {key} from {path}: {e}")
-            return
-
-    # Process and analyze each DataFrame
-    processed_dataframes = {}
-    for name, df in dataframes.items():
-        print(f"\nAnalyzing {name}...")
-        processed_dataframes[name] = process_and_analyze(df, name)
-        
-        # Perform statistical tests on 'long_math_results' DataFrame only
-        if name == "long_math_results":
-            print("\nLONG MATH ANOVA...")
-            perform_statistical_test(processed_dataframes[name])
-
-            # Save bar chart for long math results
-            save_bar_chart(processed_dataframes[name], output_dir="./figures", filename="long_math_accuracy.png")
-
-    # Perform a t-test on the overall accuracy of math_results vs long_math_results
-    print("\nT-TEST...")
-    math_results = processed_dataframes["math_results"]
-    long_math_results = processed_dataframes["long_math_results"]
-
-    t_stat, p_value = stats.ttest_ind(
-        math_results["response"].dropna(), long_math_results["response"].dropna()
-    )
-
-    print(f"Math results accuracy: {accuracy(math_results['response'].tolist())}")
-    print(f"Long math results accuracy: {accuracy(long_math_results['response'].tolist())}")
-    print(f"T-statistic: {t_stat}, p-value: {p_value}")
-    if p_value < 0.05:
+    args = parse_args()
+    if args.reset and args.state_path and os.path.exists(args.state_path):
+        os.remove(args.state_path)
+    aggregator = ResultsAggregator(FILE_PATHS, state_path=args.state_path or None)
+    if args.watch:
+        aggregator.watch(args.interval)
+        return
+
+    new_rows = aggregator.refresh()
+    print(f"Parsed {new_rows} new result rows")
+    print(aggregator.report())
+    snapshot = aggregator.snapshot()
+    counts = {name: snapshot[snapshot["experiment"] == name] for name in FILE_PATHS}
+    missing = [name for name, rows in counts.items() if rows.empty]
+    if missing:
+        print(f"\nNo results for {', '.join(missing)}; skipping statistical tests.")
+        return
+
+    intervals = bootstrap_ci(
+        snapshot, resamples=args.resamples, confidence=args.confidence, seed=args.seed, workers=args.workers
+        )
+    print_confidence_intervals(intervals, args.confidence)
+
+    # Perform statistical tests on 'long_math_results' only
+    print("\nLONG MATH POSITIONS...")
+    perform_statistical_test(counts["long_math_results"], args)
+
+    # Save bar chart for long math results
+    long_math_intervals = bootstrap_ci(
+        counts["long_math_results"], by=["insert_position"], resamples=args.resamples,
+        confidence=args.confidence, seed=args.seed, workers=args.workers
+        )
+    save_bar_chart(long_math_intervals, output_dir="./figures", filename="long_math_accuracy.png")
+
+    # Permutation test on the overall accuracy of math_results vs long_math_results
+    print("\nMATH VS LONG MATH...")
+    pair = [tuple(int(counts[name][column].sum()) for column in ("n", "successes"))
+            for name in ("math_results", "long_math_results")]
+    result = permutation_tests(
+        [pair], resamples=args.resamples, confidence=args.confidence, seed=args.seed, workers=args.workers
+        ).iloc[0]
+
+    print(f"Math results accuracy: {result.accuracy_a}")
+    print(f"Long math results accuracy: {result.accuracy_b}")
+    print(f"Difference: {result.difference:.4f} [{result.ci_low:.4f}, {result.ci_high:.4f}], "
+          f"permutation p-value: {result.p_value}")
+    if result.p_value < 0.05:
         print("Result: Significant difference detected between math and long math results.")
     else:
         print("Result: No significant difference detected between math and long math results.")
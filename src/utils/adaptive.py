@@ -0,0 +1,113 @@
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def coarse_indices(size: int, points: int) -> List[int]:
+    """
+    `points` indices spread evenly over range(size), both ends included.
+    """
+    return sorted({int(round(x)) for x in np.linspace(0, size - 1, min(max(points, 2), size))})
+
+
+class AdaptivePositionSearch:
+    """
+    Adaptive sampling of one malicious question's insert positions out of a candidate grid.
+    Starts from `coarse_points` evenly spaced candidates, then repeatedly bisects the widest
+    stretch of the grid whose two ends were judged differently, until the question's call
+    budget is spent or every transition lies between neighbouring candidates. Stretches with
+    the same verdict at both ends are assumed constant, so a success region narrower than the
+    coarse spacing can be missed; more coarse points trade calls for that risk. A position that
+    fails (no verdict) is proposed again up to `retries` times while budget remains.
+    """
+    def __init__(self, positions: Sequence[int], budget: int, coarse_points: int = 5, retries: int = 1):
+        """
+        Args:
+            positions: Candidate insert positions in increasing depth, e.g. the uniform grid.
+        """
+        self.positions = list(positions)
+        self.index = {position: index for index, position in enumerate(self.positions)}
+        self.budget = budget
+        self.retries = retries
+        self.coarse = coarse_indices(len(self.positions), coarse_points) if self.positions else []
+        self.pending = list(self.coarse)
+        self.observed: Dict[int, float] = {}  # candidate index -> verdict
+        self.failures: Dict[int, int] = {}  # candidate index -> calls without a verdict
+        self.calls = 0
+
+    def record(self, position: int, verdict: Optional[float]):
+        """
+        Record a judged cell; None (failed generation or unparseable verdict) uses up the
+        call without informing the search. Positions outside the candidate grid are ignored.
+        """
+        index = self.index.get(position)
+        if index is None:
+            return
+        self.calls += 1
+        if verdict is None:
+            self.failures[index] = self.failures.get(index, 0) + 1
+        else:
+            self.observed[index] = float(verdict)
+
+    def _can_try(self, index: int) -> bool:
+        # Not judged yet and not out of retries
+        return index not in self.observed and self.failures.get(index, 0) <= self.retries
+
+    def transitions(self) -> List[Tuple[int, int]]:
+        """
+        Neighbouring observed candidate indices whose verdicts differ, widest first.
+        """
+        points = sorted(self.observed)
+        pairs = [(a, b) for a, b in zip(points, points[1:]) if self.observed[a] != self.observed[b]]
+        return sorted(pairs, key=lambda pair: pair[0] - pair[1])
+
+    def propose(self) -> List[int]:
+        """
+        Positions to evaluate next, within the remaining budget; empty when the search is done.
+        The coarse grid goes first, then failed coarse positions and the midpoint of every
+        unresolved transition (again, if it failed).
+        """
+        remaining = self.budget - self.calls
+        if remaining <= 0:
+            return []
+        if self.pending:
+            proposals = [index for index in self.pending if self._can_try(index)][:remaining]
+            self.pending = []
+            if proposals:
+                return [self.positions[index] for index in proposals]
+        proposals = [index for index in self.coarse if index in self.failures and self._can_try(index)]
+        for a, b in self.transitions():
+            middle = (a + b) // 2
+            if b - a > 1 and self._can_try(middle):
+                proposals.append(middle)
+        return [self.positions[index] for index in proposals[:remaining]]
+
+    def curve(self) -> np.ndarray:
+        """
+        Estimated success at every candidate position: exact where constant, linear across
+        unresolved transitions.
+        """
+        points = sorted(self.observed)
+        if not points:
+            return np.full(len(self.positions), np.nan)
+        return np.interp(range(len(self.positions)), points, [self.observed[point] for point in points])
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "observed": {str(self.positions[index]): self.observed[index] for index in sorted(self.observed)},
+            # Each transition brackets a depth threshold between two judged positions
+            "transitions": [[self.positions[a], self.positions[b]] for a, b in sorted(self.transitions())],
+            # Transitions not narrowed to neighbouring candidates (budget spent or midpoint kept failing)
+            "unresolved": [[self.positions[a], self.positions[b]] for a, b in sorted(self.transitions()) if b - a > 1],
+            "failed": [self.positions[index] for index in sorted(self.failures) if index not in self.observed],
+        }
+
+
+def add_adaptive_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--budget", type=int, default=12, help="Maximum generation calls per malicious question.")
+    parser.add_argument("--coarse_points", type=int, default=5,
+                        help="Evenly spaced grid positions (ends included) evaluated before refining.")
+    parser.add_argument("--position_retries", type=int, default=1,
+                        help="Times a position that got no verdict is tried again, within --budget.")
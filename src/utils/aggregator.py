@@ -0,0 +1,217 @@
+import json
+import os
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.storage import has_columnar, load_table
+
+# Results rows written before the judge recorded the generating model
+UNKNOWN_MODEL = "unknown"
+COUNT_COLUMNS = ["n", "successes", "invalid"]
+KEY_COLUMNS = ["experiment", "model", "insert_position"]
+# Fields a verdict count needs; the generation text is never decoded into a frame
+RESULT_FIELDS = ["model", "insert_position", "response"]
+# Bytes checksummed at the start of a file and just before the saved offset
+FINGERPRINT_BYTES = 4096
+
+Key = Tuple[str, str, int]
+
+
+def parse_results_chunk(chunk: bytes, default_model: str = UNKNOWN_MODEL) -> pd.DataFrame:
+    """
+    Parse complete JSONL results lines into (model, insert_position, response), picking
+    those fields from each line.
+    """
+    rows = [json.loads(line) for line in chunk.splitlines() if line.strip()]
+    return results_frame(
+        pd.DataFrame({field: [row.get(field) for row in rows] for field in RESULT_FIELDS}), default_model
+        )
+
+
+def results_frame(df: pd.DataFrame, default_model: str = UNKNOWN_MODEL) -> pd.DataFrame:
+    """
+    Normalize results columns to (model, insert_position, response), with response converted
+    to numbers in one pass; unparseable verdicts become NaN.
+    """
+    if "model" in df.columns:
+        model = df["model"].fillna(default_model).astype(str)
+    else:
+        model = pd.Series(default_model, index=df.index)
+    if "insert_position" in df.columns:
+        insert_position = pd.to_numeric(df["insert_position"], errors="coerce").fillna(0).astype(int)
+    else:
+        insert_position = pd.Series(0, index=df.index)
+    return pd.DataFrame({
+        "model": model,
+        "insert_position": insert_position,
+        "response": pd.to_numeric(df["response"], errors="coerce"),
+    })
+
+
+class ResultsAggregator:
+    """
+    Running verdict counts per (experiment, model, insert_position) over results files that
+    are appended to while a run is going. The byte offset reached in each file is saved with
+    the counts, so a refresh only parses the rows written since the last one. A file that
+    was rewritten (finalize/resume compaction replaces it, or it was overwritten in place) is
+    recounted from the start; in-place rewrites are caught by checksums of the file's first
+    bytes and of the bytes before the offset.
+    """
+    def __init__(self, files: Dict[str, str], state_path: Optional[str] = None, default_model: str = UNKNOWN_MODEL):
+        """
+        Args:
+            files: experiment name -> results JSONL path.
+            state_path: JSON file for offsets and counts; None keeps the state in memory only.
+        """
+        self.files = dict(files)
+        self.state_path = state_path
+        self.default_model = default_model
+        self.offsets: Dict[str, dict] = {}
+        self.counts: Dict[Key, list] = {}
+        if state_path and os.path.exists(state_path):
+            self._load_state()
+
+    def _load_state(self):
+        with open(self.state_path, 'r') as i_file:
+            state = json.load(i_file)
+        self.offsets = state.get("files", {})
+        self.counts = {
+            (record["experiment"], record["model"], record["insert_position"]): [record[name] for name in COUNT_COLUMNS]
+            for record in state.get("counts", [])
+        }
+
+    def save(self):
+        if not self.state_path:
+            return
+        state = {
+            "files": self.offsets,
+            "counts": [
+                {**dict(zip(KEY_COLUMNS, key)), **dict(zip(COUNT_COLUMNS, values))}
+                for key, values in sorted(self.counts.items())
+            ],
+        }
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as o_file:
+            json.dump(state, o_file)
+        os.replace(tmp_path, self.state_path)
+
+    def _reset(self, experiment: str):
+        self.counts = {key: values for key, values in self.counts.items() if key[0] != experiment}
+        self.offsets.pop(experiment, None)
+
+    @staticmethod
+    def _fingerprint(i_file, offset: int) -> list:
+        # Checksums of the first bytes and of the bytes right before `offset`, so a file
+        # rewritten in place (same inode, no shorter) is told apart from one that grew
+        i_file.seek(0)
+        head = zlib.crc32(i_file.read(min(offset, FINGERPRINT_BYTES)))
+        start = max(offset - FINGERPRINT_BYTES, 0)
+        i_file.seek(start)
+        return [head, zlib.crc32(i_file.read(offset - start))]
+
+    def _consume(self, experiment: str, path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        stat = os.stat(path)
+        with open(path, 'rb') as i_file:
+            position = self.offsets.get(experiment)
+            if position is not None and (
+                position["path"] != path or position["inode"] != stat.st_ino or stat.st_size < position["offset"]
+                or position.get("fingerprint") != self._fingerprint(i_file, position["offset"])
+            ):
+                self._reset(experiment)
+                position = None
+            offset = position["offset"] if position else 0
+            if stat.st_size == offset:
+                return 0
+
+            if offset == 0 and has_columnar(path):
+                # A finalized file with an up-to-date Parquet copy: read just the needed columns
+                df = results_frame(load_table(path, RESULT_FIELDS), self.default_model)
+                end = stat.st_size
+            else:
+                i_file.seek(offset)
+                data = i_file.read(stat.st_size - offset)
+                # A line still being written is left for the next refresh
+                end = data.rfind(b"\n") + 1
+                df = parse_results_chunk(data[:end], self.default_model)
+            self.offsets[experiment] = {
+                "path": path, "inode": stat.st_ino, "offset": offset + end,
+                "fingerprint": self._fingerprint(i_file, offset + end),
+            }
+        if df.empty:
+            return 0
+
+        df["invalid"] = df["response"].isna().astype(int)
+        df["n"] = 1 - df["invalid"]
+        df["successes"] = df["response"].fillna(0)
+        grouped = df.groupby(["model", "insert_position"])[COUNT_COLUMNS].sum()
+        for (model, insert_position), values in zip(grouped.index, grouped.itertuples(index=False)):
+            key = (experiment, str(model), int(insert_position))
+            running = self.counts.setdefault(key, [0, 0, 0])
+            for i, value in enumerate(values):
+                running[i] += value.item() if hasattr(value, "item") else value
+        return len(df)
+
+    def refresh(self) -> int:
+        """
+        Consume rows appended since the last refresh and save the state.
+        Returns:
+            int: Number of new rows.
+        """
+        new_rows = sum(self._consume(experiment, path) for experiment, path in self.files.items())
+        self.save()
+        return new_rows
+
+    def snapshot(self) -> pd.DataFrame:
+        """
+        Returns:
+            pd.DataFrame: One row per (experiment, model, insert_position) with n (valid verdicts),
+            successes, invalid and accuracy = successes / n.
+        """
+        records = [list(key) + values for key, values in sorted(self.counts.items())]
+        df = pd.DataFrame(records, columns=KEY_COLUMNS + COUNT_COLUMNS)
+        df["accuracy"] = df["successes"] / df["n"].where(df["n"] > 0)
+        return df
+
+    def report(self) -> str:
+        """
+        Overall and per-position accuracy for every experiment, in the format results.py prints.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for experiment in self.files:
+            rows = snapshot[snapshot["experiment"] == experiment]
+            if rows.empty:
+                lines.append(f"\n{experiment}: no results yet")
+                continue
+            for model, model_rows in rows.groupby("model"):
+                n = model_rows["n"].sum()
+                overall = model_rows["successes"].sum() / n if n else 0.0
+                lines.append(f"\n{experiment} ({model}) Overall accuracy: {overall} "
+                             f"(n={n}, invalid={model_rows['invalid'].sum()})")
+                for row in model_rows.itertuples(index=False):
+                    lines.append(f"Accuracy for position {row.insert_position}: {row.accuracy} (n={row.n})")
+        return "\n".join(lines)
+
+    def watch(self, interval: float = 10.0, iterations: Optional[int] = None):
+        """
+        Refresh every `interval` seconds and print the report whenever new rows arrived.
+        Stops after `iterations` refreshes (None runs until interrupted).
+        """
+        done = 0
+        try:
+            while iterations is None or done < iterations:
+                new_rows = self.refresh()
+                if new_rows or done == 0:
+                    print(f"\n[{time.strftime('%H:%M:%S')}] +{new_rows} rows")
+                    print(self.report())
+                done += 1
+                if iterations is None or done < iterations:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Per-file limits of the Batch API are 200 MB and 50,000 requests; stay a little under the size
+MAX_FILE_MB = 190
+MAX_FILE_REQUESTS = 50000
+# Deliberately low characters-per-token ratio, so estimates err above the real count
+CHARS_PER_TOKEN = 3
+
+
+def make_custom_id(mal_q_id: str, insert_position: int, idx: Union[int, None] = None, occurrence: int = 0) -> str:
+    # The judge passes the generation idx (and its occurrence, for a repeated idx), since a
+    # dataset can repeat a question id
+    custom_id = f"{mal_q_id}::{insert_position}"
+    if idx is None:
+        return custom_id
+    return f"{idx}#{occurrence}::{custom_id}" if occurrence else f"{idx}::{custom_id}"
+
+
+def parse_custom_id(custom_id: str) -> Tuple[str, int]:
+    mal_q_id, insert_position = custom_id.rsplit("::", 1)
+    return mal_q_id, int(insert_position)
+
+
+def batch_request(custom_id: str, model: str, messages: list, gen_params: dict) -> dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {"model": model, "messages": messages, **gen_params},
+    }
+
+
+def estimate_request_tokens(request: dict) -> int:
+    """
+    Upper-end estimate of the tokens a request adds to the batch queue: its messages plus the
+    completion allowance.
+    """
+    body = request["body"]
+    chars = sum(len(message["content"] or "") for message in body["messages"])
+    return chars // CHARS_PER_TOKEN + 1 + (body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+
+
+def write_batch_files(
+        path: str, requests: Iterable[dict], max_mb: float = MAX_FILE_MB, max_tokens: Optional[int] = None
+        ) -> List[dict]:
+    """
+    Stream batch requests into JSONL part files next to `path` (<stem>.000.jsonl, ...). A new
+    part is started before one would exceed `max_mb`, MAX_FILE_REQUESTS or, if set,
+    `max_tokens` estimated tokens, so every part can be submitted as its own batch.
+    Returns:
+        list: One {"path", "requests", "tokens", "bytes"} dict per part, in order.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    stem = os.path.splitext(path)[0]
+    max_bytes = int(max_mb * 1024 * 1024)
+    parts = []
+    o_file = None
+    try:
+        for request in requests:
+            line = (json.dumps(request) + "\n").encode()
+            tokens = estimate_request_tokens(request)
+            part = parts[-1] if parts else None
+            if part is None or part["requests"] >= MAX_FILE_REQUESTS or part["bytes"] + len(line) > max_bytes \
+                    or (max_tokens and part["tokens"] + tokens > max_tokens):
+                if o_file is not None:
+                    o_file.close()
+                part = {"path": f"{stem}.{len(parts):03d}.jsonl", "requests": 0, "tokens": 0, "bytes": 0}
+                parts.append(part)
+                o_file = open(part["path"], 'wb')
+            o_file.write(line)
+            part["requests"] += 1
+            part["tokens"] += tokens
+            part["bytes"] += len(line)
+    finally:
+        if o_file is not None:
+            o_file.close()
+    return parts
+
+
+def read_batch_output(path: str) -> Dict[str, Union[str, None]]:
+    """
+    Parse a batch output file into {custom_id: completion}; failed requests map to None.
+    """
+    results = {}
+    with open(path, 'r') as i_file:
+        for line in i_file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            content = None
+            if entry.get("error") is None and response.get("status_code") == 200:
+                content = response["body"]["choices"][0]["message"]["content"]
+                content = content.strip() if content is not None else None
+            results[entry["custom_id"]] = content
+    return results
+
+
+class OpenAIBatchBackend:
+    """
+    Submits request files to the OpenAI Batch API.
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, requests_path: str) -> str:
+        with open(requests_path, 'rb') as i_file:
+            input_file = self.client.files.create(file=i_file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> dict:
+        batch = self.client.batches.retrieve(batch_id)
+        return {
+            "status": batch.status,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+        }
+
+    def download(self, batch_id: str, output_path: str):
+        status = self.status(batch_id)
+        with open(output_path, 'wb') as o_file:
+            for file_id in (status["output_file_id"], status["error_file_id"]):
+                if file_id:
+                    o_file.write(self.client.files.content(file_id).read())
+
+
+def echo_responder(model: str, messages: list, gen_params: dict) -> str:
+    # Deterministic stand-in completion
+    return f"[local batch] {messages[-1]['content'][:200]}"
+
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the batch endpoint. Each batch is a directory under `batch_dir`
+    holding the submitted requests, a status file and, once polled, an output file in the
+    same format as the OpenAI Batch API, produced by `responder`.
+    """
+    def __init__(self, batch_dir: str = "./data/batches", responder: Callable[[str, list, dict], str] = echo_responder):
+        self.batch_dir = batch_dir
+        self.responder = responder
+
+    def _path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.batch_dir, batch_id, name)
+
+    def _write_status(self, batch_id: str, status: str):
+        with open(self._path(batch_id, "status.json"), 'w') as o_file:
+            json.dump({"status": status}, o_file)
+
+    def submit(self, requests_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.batch_dir, batch_id), exist_ok=True)
+        shutil.copyfile(requests_path, self._path(batch_id, "input.jsonl"))
+        self._write_status(batch_id, "in_progress")
+        return batch_id
+
+    def _process(self, batch_id: str):
+        with open(self._path(batch_id, "input.jsonl"), 'r') as i_file, \
+                open(self._path(batch_id, "output.jsonl"), 'w') as o_file:
+            for line in i_file:
+                request = json.loads(line)
+                body = dict(request["body"])
+                model, messages = body.pop("model"), body.pop("messages")
+                try:
+                    content = self.responder(model, messages, body)
+                    entry = {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]},
+                        },
+                        "error": None,
+                    }
+                except Exception as e:
+                    entry = {"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}}
+                o_file.write(json.dumps(entry) + "\n")
+        self._write_status(batch_id, "completed")
+
+    def status(self, batch_id: str) -> dict:
+        with open(self._path(batch_id, "status.json"), 'r') as i_file:
+            status = json.load(i_file)["status"]
+        if status == "in_progress":
+            self._process(batch_id)
+            status = "completed"
+        return {"status": status}
+
+    def download(self, batch_id: str, output_path: str):
+        shutil.copyfile(self._path(batch_id, "output.jsonl"), output_path)
+
+
+def load_batch_state(state_path: str) -> dict:
+    """
+    State of submitted but not yet merged batches, or {} if there is none.
+    """
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, 'r') as i_file:
+        state = json.load(i_file)
+    if "batch_id" in state:
+        # Single-batch state written before request files were split
+        state["parts"] = [
+            {"path": state.pop("requests_path"), "tokens": 0, "batch_id": state.pop("batch_id"), "status": "submitted"}
+            ]
+    return state
+
+
+def save_batch_state(state_path: str, state: dict):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, 'w') as o_file:
+        json.dump(state, o_file)
+    os.replace(tmp_path, state_path)
+
+
+def run_batch(
+        backend,
+        parts: List[dict],
+        state_path: str,
+        max_tokens: Optional[int] = None,
+        poll_interval: float = 60.0,
+        metadata: Optional[dict] = None,
+        log: Callable[[str], None] = print
+        ) -> Dict[str, Union[str, None]]:
+    """
+    Submit every part written by write_batch_files as its own batch (or reattach to the batches
+    recorded in `state_path`) and poll until all of them finish, keeping at most `max_tokens`
+    estimated tokens enqueued at a time. Each output is downloaded next to its requests and
+    the merged {custom_id: completion} is returned. Batch ids are saved to the state file as
+    soon as they are submitted, together with `metadata` so an interrupted run can rebuild
+    its inputs.
+    """
+    state = load_batch_state(state_path)
+    if "parts" in state:
+        log(f"Reattached to {len(state['parts'])} batch(es)")
+    else:
+        state = {"parts": [{**part, "batch_id": None, "status": "pending"} for part in parts], **(metadata or {})}
+        save_batch_state(state_path, state)
+    parts = state["parts"]
+
+    while any(part["status"] != "completed" for part in parts):
+        # Submit in order while the queue has room; one part is always allowed on its own
+        enqueued = sum(part["tokens"] for part in parts if part["status"] == "submitted")
+        for part in parts:
+            if part["status"] != "pending":
+                continue
+            if max_tokens and enqueued and enqueued + part["tokens"] > max_tokens:
+                break
+            part["batch_id"] = backend.submit(part["path"])
+            part["status"] = "submitted"
+            enqueued += part["tokens"]
+            save_batch_state(state_path, state)
+            log(f"Submitted batch {part['batch_id']} ({part['requests']} requests, ~{part['tokens']} tokens)")
+
+        finished = False
+        for part in parts:
+            if part["status"] != "submitted":
+                continue
+            status = backend.status(part["batch_id"])["status"]
+            if status in ("failed", "expired", "cancelled"):
+                raise RuntimeError(f"Batch {part['batch_id']} ended with status {status}")
+            if status == "completed":
+                backend.download(part["batch_id"], os.path.splitext(part["path"])[0] + ".output.jsonl")
+                part["status"] = "completed"
+                save_batch_state(state_path, state)
+                finished = True
+            else:
+                log(f"Batch {part['batch_id']} status: {status}")
+        if not finished and any(part["status"] != "completed" for part in parts):
+            time.sleep(poll_interval)
+
+    results = {}
+    for part in parts:
+        results.update(read_batch_output(os.path.splitext(part["path"])[0] + ".output.jsonl"))
+    os.remove(state_path)
+    return results
+
+
+def add_batch_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--batch", action="store_true",
+                        help="Write all requests to a batch file, submit it, wait for it and merge the results.")
+    parser.add_argument("--batch_backend", type=str, default="openai", choices=["openai", "local"],
+                        help="'local' processes the batch file with a file-based stand-in instead of the API.")
+    parser.add_argument("--batch_dir", type=str, default="./data/batches", help="Where batch request/output files live.")
+    parser.add_argument("--poll_interval", type=float, default=60.0, help="Seconds between batch status checks.")
+    parser.add_argument("--batch_max_mb", type=float, default=MAX_FILE_MB, help="Size limit of one batch request file.")
+    parser.add_argument("--batch_max_tokens", type=int, default=None,
+                        help="Estimated tokens enqueued at once, e.g. the model's batch queue limit for the account; "
+                             "requests are split into batches that are submitted as earlier ones finish.")
+
+def backend_from_args(args: argparse.Namespace, client=None):
+    if args.batch_backend == "local":
+        return LocalBatchBackend(args.batch_dir)
+    return OpenAIBatchBackend(client)
+
+
+def batch_paths(batch_dir: str, output_path: str) -> Tuple[str, str]:
+    """
+    Requests file (numbered per part by write_batch_files) and reattach-state file for a run
+    writing to `output_path`.
+    """
+    name = os.path.splitext(os.path.basename(output_path))[0]
+    return (
+        os.path.join(batch_dir, f"{name}.requests.jsonl"),
+        os.path.join(batch_dir, f"{name}.batch_state.json"),
+    )
@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+
+def read_jsonl_rows(path: str) -> List[dict]:
+    """
+    Read every complete JSON line from `path`.
+    A truncated trailing line (e.g. from a killed run) or any corrupt line is skipped.
+    Returns:
+        list: Parsed rows, in file order. Empty if the file does not exist.
+    """
+    rows = []
+    if not os.path.exists(path):
+        return rows
+    with open(path, 'r') as i_file:
+        for line in i_file:
+            if not line.endswith("\n"):
+                break  # partial write, the rest of the file is unusable
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return rows
+
+
+def atomic_write_jsonl(path: str, rows: Iterable[dict]):
+    """
+    Write `rows` to a temporary file next to `path`, fsync it and rename it over `path`,
+    so readers only ever see the old or the new file.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".jsonl")
+    try:
+        with os.fdopen(fd, 'w') as o_file:
+            for row in rows:
+                o_file.write(json.dumps(row) + "\n")
+            o_file.flush()
+            os.fsync(o_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+def _fsync_dir(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class CheckpointWriter:
+    """
+    Append-only JSONL writer that only ever writes whole lines and fsyncs them.
+
+    With `resume=True` the existing file is compacted first: only rows accepted by
+    `is_complete` are kept (one per key, the last one wins), so failed or truncated rows
+    are re-queued by the caller. Without it the file is started fresh.
+
+    Rows are buffered and fsync'd every `flush_every` rows; a crash loses at most the
+    unflushed rows, which are then re-queued like any other missing row.
+    """
+    def __init__(
+            self,
+            path: str,
+            key_fn: Callable[[dict], Hashable],
+            resume: bool = False,
+            is_complete: Optional[Callable[[dict], bool]] = None,
+            flush_every: int = 1
+            ):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.buffer: List[str] = []
+        self.key_fn = key_fn
+        self.is_complete = is_complete or (lambda row: True)
+        self.lock = threading.Lock()
+        self.completed: Dict[Hashable, dict] = {}
+
+        if resume:
+            for row in read_jsonl_rows(path):
+                if self.is_complete(row):
+                    self.completed[key_fn(row)] = row
+        atomic_write_jsonl(path, self.completed.values())
+        self.file = open(path, 'a')
+
+    def is_done(self, key: Hashable) -> bool:
+        return key in self.completed
+
+    def write(self, row: dict):
+        line = json.dumps(row) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            if self.is_complete(row):
+                self.completed[self.key_fn(row)] = row
+            if len(self.buffer) >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        # Whole lines only, then fsync, so a crash leaves at most a partial last line
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def finalize(self, sort_key: Optional[Callable[[dict], object]] = None):
+        """
+        Close the writer and atomically rewrite the file with one row per key,
+        optionally sorted by `sort_key`.
+        """
+        self.close()
+        latest = {}
+        for row in read_jsonl_rows(self.path):
+            latest[self.key_fn(row)] = row
+        rows = list(latest.values())
+        if sort_key is not None:
+            rows.sort(key=sort_key)
+        atomic_write_jsonl(self.path, rows)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._flush()
+                self.file.close()
@@ -0,0 +1,232 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter.
+    Args:
+        attempt (int): Zero-based retry attempt.
+        base (float): Delay in seconds for the first retry.
+        cap (float): Upper bound on the delay in seconds.
+    Returns:
+        float: Number of seconds to sleep before the next attempt.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    The bucket holds at most one minute's worth of capacity.
+    """
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.fill_rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        # A single request larger than the bucket is let through once the bucket is full
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_time = (amount - self.tokens) / self.fill_rate
+            time.sleep(wait_time)
+
+    def sync(self, remaining: float):
+        # Trust the server if it reports less headroom than we think we have
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, float(remaining))
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the number of in-flight requests with an AIMD policy: the limit grows by one
+    after a full window of successes and is halved whenever the server rate-limits us.
+    """
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.limit = self.max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, rate_limited: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(self.min_concurrency, self.limit // 2)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self.successes = 0
+            self.condition.notify_all()
+
+
+class RateLimiter:
+    """
+    Combines bounded, adaptive concurrency with requests-per-minute and tokens-per-minute
+    budgets. Callers wrap every request in `acquire(tokens)` / `release(rate_limited)`.
+    """
+    def __init__(
+            self,
+            max_concurrency: int = 1,
+            requests_per_minute: Optional[float] = None,
+            tokens_per_minute: Optional[float] = None
+            ):
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def counts_tokens(self) -> bool:
+        return self.tokens is not None
+
+    def acquire(self, tokens: int = 0):
+        self.concurrency.acquire()
+        # Honour any server-requested pause before spending budget
+        while True:
+            with self.lock:
+                delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            time.sleep(delay)
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            self.tokens.acquire(tokens)
+
+    def release(self, rate_limited: bool = False):
+        self.concurrency.release(rate_limited)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """
+        Align the local buckets with the x-ratelimit-* headers returned by the API.
+        """
+        if headers is None:
+            return
+        remaining_requests = _parse_number(headers.get("x-ratelimit-remaining-requests"))
+        remaining_tokens = _parse_number(headers.get("x-ratelimit-remaining-tokens"))
+        if self.requests is not None and remaining_requests is not None:
+            self.requests.sync(remaining_requests)
+        if self.tokens is not None and remaining_tokens is not None:
+            self.tokens.sync(remaining_tokens)
+        # Out of either budget: wait until the server says it resets
+        if remaining_requests == 0 or remaining_tokens == 0:
+            reset = max(
+                parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0,
+                parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0,
+            )
+            if reset:
+                self.pause(reset)
+
+
+def _parse_number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_duration(value) -> Optional[float]:
+    """
+    Parse durations such as '1s', '250ms', '6m0s' or a plain number of seconds.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    number = _parse_number(value)
+    if number is not None:
+        return number
+    total, digits = 0.0, ""
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch.isdigit() or ch == ".":
+            digits += ch
+        elif value.startswith("ms", i):
+            total += float(digits or 0) / 1000
+            digits = ""
+            i += 1
+        elif ch in "hms":
+            total += float(digits or 0) * {"h": 3600, "m": 60, "s": 1}[ch]
+            digits = ""
+        else:
+            return None
+        i += 1
+    return total
+
+
+def run_ordered(
+        items: Iterable[Any],
+        fn: Callable[[Any], Any],
+        max_workers: int = 1,
+        max_in_flight: Optional[int] = None
+        ) -> Iterator[Tuple[Any, Any]]:
+    """
+    Apply `fn` to `items` on a thread pool and yield `(item, result)` in input order.
+    At most `max_in_flight` items are pulled from `items` before their results are
+    yielded, so lazily produced inputs stay bounded in memory.
+    Args:
+        items (Iterable): Work items, consumed lazily.
+        fn (Callable): Function applied to each item. Exceptions propagate to the caller.
+        max_workers (int): Number of worker threads.
+        max_in_flight (int): Bound on submitted-but-not-yielded items (default 2 * max_workers).
+    """
+    max_in_flight = max_in_flight or 2 * max_workers
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        done_results = {}
+        submitted = 0
+        next_to_yield = 0
+        exhausted = False
+        while True:
+            while not exhausted and submitted - next_to_yield < max_in_flight:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                futures[executor.submit(fn, item)] = (submitted, item)
+                submitted += 1
+            if next_to_yield == submitted and exhausted:
+                return
+            if next_to_yield not in done_results:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    position, item = futures.pop(future)
+                    done_results[position] = (item, future.result())
+            while next_to_yield in done_results:
+                yield done_results.pop(next_to_yield)
+                next_to_yield += 1
@@ -0,0 +1,44 @@
+import hashlib
+import re
+from typing import Dict, Iterable, List, Tuple
+
+# Echoed malicious/benign keys differ from row to row but say nothing about alignment
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_generation(text) -> str:
+    """
+    Replace UUIDs with a placeholder and collapse whitespace so near-identical
+    generations compare equal.
+    """
+    text = UUID_PATTERN.sub("<uuid>", str(text))
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def generation_hash(text) -> str:
+    return hashlib.sha1(normalize_generation(text).encode("utf-8")).hexdigest()
+
+
+def group_duplicates(generations: Iterable) -> Tuple[List[str], Dict[str, List[int]]]:
+    """
+    Hash every generation after normalization.
+    Returns:
+        tuple: The hash of each generation, and {hash: indices of the generations sharing it}
+        in first-seen order (the first index is the representative to judge).
+    """
+    hashes = [generation_hash(generation) for generation in generations]
+    groups: Dict[str, List[int]] = {}
+    for i, digest in enumerate(hashes):
+        groups.setdefault(digest, []).append(i)
+    return hashes, groups
+
+
+def dedup_report(n_rows: int, n_unique: int) -> str:
+    saved = n_rows - n_unique
+    ratio = n_rows / n_unique if n_unique else 0.0
+    share = saved / n_rows if n_rows else 0.0
+    return (
+        f"Dedup: {n_rows} rows -> {n_unique} unique generations "
+        f"(ratio {ratio:.2f}x, {saved} judge calls saved, {share:.1%})"
+    )
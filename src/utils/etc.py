@@ -1,19 +1,50 @@
 import json
 import os
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List
 from dotenv import load_dotenv
 import tiktoken
 
+@lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o-mini") -> tiktoken.Encoding:
+    """
+    Load the tokenizer for `model` once per process.
+    """
+    return tiktoken.encoding_for_model(model)
+
 def token_counter(text: str, model: str = "gpt-4o-mini"):
-    # Load the tokenizer for the model
-    encoding = tiktoken.encoding_for_model(model)
+    # Tokenize the input with the cached encoder and count the tokens
+    return len(get_encoding(model).encode(text))
 
-    # Tokenize the input
-    tokenized_input = encoding.encode(text)
+class TokenCounter:
+    """
+    Token counts memoized per unique text, with uncached texts encoded in
+    multi-threaded batches.
+    """
+    def __init__(self, model: str = "gpt-4o-mini", num_threads: int = 8):
+        self.encoding = get_encoding(model)
+        self.num_threads = num_threads
+        self.counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
 
-    # Count the number of tokens (list length)
-    token_count = len(tokenized_input)
+    def count(self, text: str) -> int:
+        count = self.counts.get(text)
+        if count is None:
+            count = len(self.encoding.encode(text))
+            with self.lock:
+                self.counts[text] = count
+        return count
 
-    return token_count
+    def count_many(self, texts: Iterable[str]) -> List[int]:
+        texts = list(texts)
+        missing = list({text for text in texts if text not in self.counts})
+        if missing:
+            encoded = self.encoding.encode_batch(missing, num_threads=self.num_threads)
+            with self.lock:
+                for text, tokens in zip(missing, encoded):
+                    self.counts[text] = len(tokens)
+        return [self.counts[text] for text in texts]
 
 def load_json_list(json_path: str) -> list:
     """
@@ -0,0 +1,105 @@
+import argparse
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+def plan_batches(
+        lengths: Sequence[int], max_batch_size: int, max_batch_tokens: int, max_new_tokens: int = 0
+        ) -> List[List[int]]:
+    """
+    Group prompt indices into batches of similar length. Prompts are taken shortest first and
+    a batch is closed when it is full or when its padded size, rows x (longest prompt +
+    max_new_tokens), would exceed max_batch_tokens. A prompt over the budget runs alone.
+    """
+    batches, batch, longest = [], [], 0
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        padded = (len(batch) + 1) * (max(longest, lengths[index]) + max_new_tokens)
+        if batch and (len(batch) >= max_batch_size or padded > max_batch_tokens):
+            batches.append(batch)
+            batch, longest = [], 0
+        batch.append(index)
+        longest = max(longest, lengths[index])
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class LocalBatchScheduler:
+    """
+    Batched generation for a local HuggingFaceProcessor. Requests are read in windows of
+    `window_batches` full batches, so prompts are only encoded a window at a time, and every
+    window is split into length-sorted batches by plan_batches. Results come back in batch
+    order (not request order) together with the request they belong to. Without
+    `max_batch_tokens` the budget is derived from the loaded model (batch_token_budget).
+    """
+    def __init__(self, processor, max_batch_size: int = 8, max_batch_tokens: Optional[int] = None, window_batches: int = 4):
+        self.processor = processor
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.window_batches = window_batches
+        self.stats = {
+            "prompts": 0, "batches": 0, "failed": 0, "prompt_tokens": 0, "padded_prompt_tokens": 0,
+            "generated_tokens": 0, "seconds": 0.0,
+        }
+
+    def _run_window(self, window: list, encode: Callable) -> Iterator[Tuple[object, Union[str, None], float]]:
+        prompts = [encode(item)[1] for item in window]
+        max_new_tokens = self.processor.generation_params().get("max_new_tokens", 0)
+        for batch in plan_batches([len(ids) for ids in prompts], self.max_batch_size, self.max_batch_tokens, max_new_tokens):
+            start = time.perf_counter()
+            try:
+                outputs = self.processor.generate_batch([prompts[i] for i in batch])
+            except Exception as e:
+                print(f"Error generating batch of {len(batch)}: {e}")
+                outputs = [(None, 0)] * len(batch)
+                self.stats["failed"] += len(batch)
+            latency = time.perf_counter() - start
+
+            self.stats["prompts"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["prompt_tokens"] += sum(len(prompts[i]) for i in batch)
+            self.stats["padded_prompt_tokens"] += len(batch) * max(len(prompts[i]) for i in batch)
+            self.stats["generated_tokens"] += sum(generated for _, generated in outputs)
+            self.stats["seconds"] += latency
+            for i, (completion, _) in zip(batch, outputs):
+                yield window[i], completion, latency
+
+    def run(self, items: Iterable, encode: Callable) -> Iterator[Tuple[object, Union[str, None], float]]:
+        """
+        Args:
+            items: Requests, e.g. generate.py's (idx, cell) jobs.
+            encode: item -> processor.encode_prompt(...) result (text, token ids).
+        Yields:
+            tuple: (item, completion or None on failure, latency of its batch in seconds).
+        """
+        self.processor.ensure_loaded()
+        if self.max_batch_tokens is None:
+            self.max_batch_tokens = self.processor.batch_token_budget()
+        window = []
+        for item in items:
+            window.append(item)
+            if len(window) >= self.max_batch_size * self.window_batches:
+                yield from self._run_window(window, encode)
+                window = []
+        if window:
+            yield from self._run_window(window, encode)
+
+    def throughput(self) -> dict:
+        seconds = self.stats["seconds"] or float("nan")
+        return {
+            **self.stats,
+            "max_batch_tokens": self.max_batch_tokens,
+            "prompts_per_second": self.stats["prompts"] / seconds,
+            "generated_tokens_per_second": self.stats["generated_tokens"] / seconds,
+            "mean_batch_size": self.stats["prompts"] / max(self.stats["batches"], 1),
+            # Share of prompt positions that were padding
+            "padding_ratio": 1 - self.stats["prompt_tokens"] / max(self.stats["padded_prompt_tokens"], 1),
+        }
+
+
+def add_local_batching_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--local_batch_size", type=int, default=1,
+                        help="Prompts per batched generate() call for local models (1 keeps one prompt at a time).")
+    parser.add_argument("--local_batch_tokens", type=int, default=None,
+                        help="Token budget of a local batch: rows x (longest prompt + max_new_tokens). "
+                             "Derived from the model's free GPU memory and context length when omitted.")
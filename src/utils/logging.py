@@ -1,22 +1,98 @@
 from datetime import datetime
+import atexit
+import json
 import os
+import queue
+import threading
+import time
 
-def gen_logger(type_log: str = "INFO", message: str='', log_file: str = "logs/generate.log", init: bool = False):
-    # Ensure log directory exists
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-    
-    # Initialize new run header if requested
-    if init:
-        with open(log_file, 'a') as f:
-            f.write("\n" + "="*40 + f"\nNew Run at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n" + "="*40 + "\n")
-
-    # Format the log entry with timestamp and log type
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"{timestamp} [{type_log}] {message}\n"
-    
-    # Append the log entry to the file
-    try:
-        with open(log_file, "a") as f:
-            f.write(log_entry)
-    except IOError as e:
-        print(f"Logging Error: {e}")
\ No newline at end of file
+_STOP = object()
+
+class StructuredLogger:
+    """
+    Non-blocking JSON-lines logger. Callers only enqueue records; a background thread keeps
+    the log file open and writes them in batches, flushing at most every `flush_interval`
+    seconds or every `batch_size` records.
+    """
+    def __init__(self, log_file: str = "logs/generate.log", name: str = None,
+                 flush_interval: float = 0.5, batch_size: int = 512):
+        # Ensure log directory exists
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        self.log_file = log_file
+        self.name = name or os.path.splitext(os.path.basename(log_file))[0]
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name=f"logger-{self.name}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, level: str, message: str = '', **fields):
+        """
+        Enqueue one record. Extra keyword arguments (idx, mal_q_id, insert_position, latency,
+        tokens, ...) become top-level fields so logs can be aggregated.
+        """
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "level": level,
+            "logger": self.name,
+            "message": message,
+        }
+        record.update(fields)
+        self.queue.put(record)
+
+    def info(self, message: str = '', **fields):
+        self.log("INFO", message, **fields)
+
+    def warning(self, message: str = '', **fields):
+        self.log("WARNING", message, **fields)
+
+    def error(self, message: str = '', **fields):
+        self.log("ERROR", message, **fields)
+
+    def _run(self):
+        with open(self.log_file, "a") as f:
+            while True:
+                record = self.queue.get()
+                batch = [record]
+                deadline = time.monotonic() + self.flush_interval
+                while record is not _STOP and len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = self.queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    batch.append(record)
+                try:
+                    f.write("".join(json.dumps(r, default=str) + "\n" for r in batch if r is not _STOP))
+                    f.flush()
+                except IOError as e:
+                    print(f"Logging Error: {e}")
+                if batch[-1] is _STOP:
+                    return
+
+    def close(self):
+        """
+        Flush everything that was enqueued and stop the writer thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(_STOP)
+        self.thread.join()
+
+_LOGGERS = {}
+_LOGGERS_LOCK = threading.Lock()
+
+def get_logger(log_file: str = "logs/generate.log") -> StructuredLogger:
+    """
+    Shared logger per log file, so every module writing to a file goes through one writer thread.
+    """
+    with _LOGGERS_LOCK:
+        logger = _LOGGERS.get(log_file)
+        if logger is None or logger.closed:
+            logger = _LOGGERS[log_file] = StructuredLogger(log_file)
+        return logger
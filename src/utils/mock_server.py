@@ -0,0 +1,263 @@
+"""
+OpenAI-compatible stand-in for /v1/chat/completions, for exercising generate.py,
+llm_as_judge.py and math_benchmark.py offline.
+
+TO RUN:
+python ./src/utils/mock_server.py --port 8000 --latency_ms 300 --error_rate_429 0.05
+export OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=mock
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Tuple
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "exponential", "lognormal")
+
+REFUSAL = "I'm sorry, but I can't help with that."
+COMPLIANCE = "Sure. Here is a step-by-step answer to the question in the dictionary entry."
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token; close enough for latency and header simulation
+    return len(text) // 4 + 1
+
+
+def default_responder(model: str, messages: list, gen_params: dict) -> str:
+    """
+    Deterministic canned output: a 0/1 verdict for judge-style requests (max_tokens <= 1),
+    otherwise a refusal or a compliance depending on a hash of the prompt.
+    """
+    digest = hashlib.sha1(messages[-1]["content"].encode("utf-8")).digest()[0]
+    if gen_params.get("max_tokens", 16) <= 1:
+        return str(digest % 2)
+    return REFUSAL if digest % 4 else COMPLIANCE
+
+
+class MockOpenAIServer:
+    """
+    Threaded HTTP server answering chat completions with simulated latency, injected
+    429/5xx errors and x-ratelimit-* headers.
+
+    Latency is `latency_ms` on average, drawn from `latency_dist`, plus `ms_per_1k_tokens`
+    for every thousand (estimated) prompt tokens. `rpm_limit` / `tpm_limit` enforce
+    fixed one-minute windows and are reflected in the rate-limit headers.
+    """
+    def __init__(
+            self,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency_ms: float = 200.0,
+            latency_dist: str = "lognormal",
+            latency_sigma: float = 0.5,
+            ms_per_1k_tokens: float = 0.0,
+            error_rate_429: float = 0.0,
+            error_rate_5xx: float = 0.0,
+            retry_after: float = 1.0,
+            rpm_limit: Optional[int] = None,
+            tpm_limit: Optional[int] = None,
+            responder: Callable[[str, list, dict], str] = default_responder,
+            seed: Optional[int] = None
+            ):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Invalid latency distribution: {latency_dist}")
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.ms_per_1k_tokens = ms_per_1k_tokens
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.retry_after = retry_after
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.responder = responder
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.window_requests = 0
+        self.window_tokens = 0
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "server_errors": 0, "prompt_tokens": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def sample_latency(self, prompt_tokens: int) -> float:
+        mean = self.latency_ms / 1000
+        if self.latency_dist == "constant" or mean <= 0:
+            base = max(mean, 0.0)
+        elif self.latency_dist == "uniform":
+            base = self.rng.uniform(0, 2 * mean)
+        elif self.latency_dist == "exponential":
+            base = self.rng.expovariate(1 / mean)
+        else:
+            # mu chosen so the distribution's mean is latency_ms
+            base = self.rng.lognormvariate(math.log(mean) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+        return base + self.ms_per_1k_tokens / 1000 * prompt_tokens / 1000
+
+    def _admit(self, prompt_tokens: int) -> Tuple[str, dict, float]:
+        """
+        Decide the outcome of one request under the lock.
+        Returns:
+            tuple: ('ok' | '429' | '5xx', rate-limit headers, latency or retry-after seconds)
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            now = time.monotonic()
+            if now - self.window_start >= 60:
+                self.window_start, self.window_requests, self.window_tokens = now, 0, 0
+            reset = max(0.0, 60 - (now - self.window_start))
+            over_limit = (self.rpm_limit is not None and self.window_requests >= self.rpm_limit) or \
+                (self.tpm_limit is not None and self.window_tokens + prompt_tokens > self.tpm_limit)
+            if not over_limit:
+                self.window_requests += 1
+                self.window_tokens += prompt_tokens
+            headers = {}
+            if self.rpm_limit is not None:
+                headers["x-ratelimit-limit-requests"] = str(self.rpm_limit)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, self.rpm_limit - self.window_requests))
+                headers["x-ratelimit-reset-requests"] = f"{reset:.3f}s"
+            if self.tpm_limit is not None:
+                headers["x-ratelimit-limit-tokens"] = str(self.tpm_limit)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, self.tpm_limit - self.window_tokens))
+                headers["x-ratelimit-reset-tokens"] = f"{reset:.3f}s"
+
+            if over_limit:
+                self.stats["rate_limited"] += 1
+                return "429", headers, reset
+            draw = self.rng.random()
+            if draw < self.error_rate_429:
+                self.stats["rate_limited"] += 1
+                return "429", headers, self.retry_after
+            if draw < self.error_rate_429 + self.error_rate_5xx:
+                self.stats["server_errors"] += 1
+                return "5xx", headers, 0.0
+            self.stats["ok"] += 1
+            return "ok", headers, self.sample_latency(prompt_tokens)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: dict, headers: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}}, {})
+                    return
+                messages = body.get("messages", [])
+                prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in messages)
+                outcome, headers, seconds = server._admit(prompt_tokens)
+                if outcome == "429":
+                    headers["retry-after"] = f"{seconds:.3f}"
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}}, headers)
+                    return
+                if outcome == "5xx":
+                    self._send(500, {"error": {"message": "Injected server error", "type": "server_error"}}, headers)
+                    return
+
+                time.sleep(seconds)
+                gen_params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+                content = server.responder(body.get("model"), messages, gen_params)
+                completion_tokens = estimate_tokens(content)
+                self._send(200, {
+                    "id": f"chatcmpl-mock-{time.monotonic_ns()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                        "prompt_tokens_details": {"cached_tokens": 0},
+                    },
+                }, headers)
+
+        return Handler
+
+
+def add_mock_server_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency_ms", type=float, default=200.0, help="Mean simulated latency per request.")
+    parser.add_argument("--latency_dist", type=str, default="lognormal", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--latency_sigma", type=float, default=0.5, help="Shape of the lognormal latency distribution.")
+    parser.add_argument("--ms_per_1k_tokens", type=float, default=0.0, help="Extra latency per 1k prompt tokens.")
+    parser.add_argument("--error_rate_429", type=float, default=0.0, help="Share of requests answered with 429.")
+    parser.add_argument("--error_rate_5xx", type=float, default=0.0, help="Share of requests answered with 500.")
+    parser.add_argument("--retry_after", type=float, default=1.0, help="retry-after seconds sent with injected 429s.")
+    parser.add_argument("--rpm_limit", type=int, default=None, help="Requests per minute before the server returns 429.")
+    parser.add_argument("--tpm_limit", type=int, default=None, help="Prompt tokens per minute before the server returns 429.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and error injection.")
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> MockOpenAIServer:
+    return MockOpenAIServer(
+        host=host,
+        port=port,
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        latency_sigma=args.latency_sigma,
+        ms_per_1k_tokens=args.ms_per_1k_tokens,
+        error_rate_429=args.error_rate_429,
+        error_rate_5xx=args.error_rate_5xx,
+        retry_after=args.retry_after,
+        rpm_limit=args.rpm_limit,
+        tpm_limit=args.tpm_limit,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a mock OpenAI-compatible chat completions server.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_mock_server_args(parser)
+    args = parser.parse_args()
+    server = server_from_args(args, host=args.host, port=args.port)
+    print(f"Serving mock chat completions at {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"Served: {server.stats}")
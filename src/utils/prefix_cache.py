@@ -0,0 +1,104 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Tuple, Union
+
+import torch
+
+
+def cache_layers(past_key_values) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    """
+    (keys, values) per layer of a transformers Cache object.
+    Handles both the layered (`cache.layers`) and the older list-based layout.
+    """
+    if hasattr(past_key_values, "layers"):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    return list(zip(past_key_values.key_cache, past_key_values.value_cache))
+
+
+def cache_nbytes(past_key_values) -> int:
+    """
+    Size in bytes of the key/value tensors held by a transformers Cache object.
+    """
+    tensors = [t for layer in cache_layers(past_key_values) for t in layer]
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None and hasattr(t, "numel"))
+
+
+def common_prefix_length(a: torch.Tensor, b: torch.Tensor) -> int:
+    """
+    Number of leading positions at which two 1-D tensors agree.
+    """
+    n = min(a.shape[-1], b.shape[-1])
+    mismatch = (a[:n] != b[:n]).nonzero()
+    return int(mismatch[0]) if len(mismatch) else n
+
+
+def _ids_key(ids: torch.Tensor) -> str:
+    return hashlib.sha1(ids.cpu().numpy().tobytes()).hexdigest()
+
+
+class PrefixKVCache:
+    """
+    LRU of prefilled `past_key_values`, keyed by the exact token ids of the prefix they hold
+    and bounded by the total size of their tensors.
+
+    Entries can be extended in place: a lookup for a longer prefix that starts with a cached
+    one returns that entry so only the new tokens need to be prefilled. Walking the insertion
+    grid position by position therefore prefills the benign context roughly once.
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (prefix ids, past_key_values, nbytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.extensions = 0
+        self.misses = 0
+
+    def lookup(self, prefix_ids: torch.Tensor) -> Tuple[Union[str, None], object, int]:
+        """
+        Find the longest cached prefix of `prefix_ids`.
+        Returns:
+            tuple: (key, past_key_values, cached length); (None, None, 0) if nothing matches.
+        """
+        key = _ids_key(prefix_ids)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            ids, past_key_values, _ = self.entries[key]
+            return key, past_key_values, ids.shape[-1]
+
+        best_key, best_length = None, 0
+        for entry_key, (ids, _, _) in self.entries.items():
+            length = ids.shape[-1]
+            if best_length < length < prefix_ids.shape[-1] and torch.equal(ids, prefix_ids[:length]):
+                best_key, best_length = entry_key, length
+        if best_key is None:
+            self.misses += 1
+            return None, None, 0
+        self.extensions += 1
+        return best_key, self.entries[best_key][1], best_length
+
+    def store(self, prefix_ids: torch.Tensor, past_key_values, replaces: Union[str, None] = None):
+        """
+        Insert (or re-key an extended entry) and evict least recently used entries
+        until the cache fits in its memory budget.
+        """
+        if replaces is not None and replaces in self.entries:
+            _, _, nbytes = self.entries.pop(replaces)
+            self.total_bytes -= nbytes
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_bytes:
+            return
+        while self.entries and self.total_bytes + nbytes > self.max_bytes:
+            _, (_, _, evicted_bytes) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_bytes
+        self.entries[_ids_key(prefix_ids)] = (prefix_ids.detach().cpu(), past_key_values, nbytes)
+        self.total_bytes += nbytes
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "mb": self.total_bytes / 1024 ** 2,
+            "hits": self.hits,
+            "extensions": self.extensions,
+            "misses": self.misses,
+        }
@@ -0,0 +1,167 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RESAMPLES = 10000
+# Resamples are drawn in fixed-size chunks, each with its own child seed, so a seed gives the
+# same result whatever the number of workers
+CHUNK_SIZE = 2500
+GROUP_COLUMNS = ["experiment", "model", "insert_position"]
+
+# The verdicts are 0/1, so resampling rows only depends on the (n, successes) counts:
+#   bootstrap:   successes in n rows drawn with replacement ~ Binomial(n, successes / n)
+#   permutation: successes landing in a group of n_k after shuffling the labels of the pooled
+#                rows ~ Hypergeometric(pooled successes, pooled failures, n_k)
+# Drawing those directly is exactly equivalent to shuffling/resampling rows, for every group
+# at once and without materializing them.
+
+
+def _chunks(resamples: int, seed: Optional[int]) -> List[Tuple[int, np.random.SeedSequence]]:
+    sizes = [CHUNK_SIZE] * (resamples // CHUNK_SIZE)
+    if resamples % CHUNK_SIZE:
+        sizes.append(resamples % CHUNK_SIZE)
+    return list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+
+
+def _run(fn: Callable, tasks: list, workers: int) -> np.ndarray:
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return np.concatenate(list(executor.map(fn, tasks)))
+    return np.concatenate([fn(task) for task in tasks])
+
+
+def _bootstrap_chunk(task) -> np.ndarray:
+    n, successes, size, seed = task
+    rng = np.random.default_rng(seed)
+    safe_n = np.maximum(n, 1)
+    return rng.binomial(n, successes / safe_n, size=(size, len(n))) / safe_n
+
+
+def _permutation_chunk(task) -> np.ndarray:
+    # Difference in accuracy between a and b for every pair, labels shuffled within the pair
+    n_a, n_b, pooled, size, seed = task
+    rng = np.random.default_rng(seed)
+    n_a_safe, n_b_safe = np.maximum(n_a, 1), np.maximum(n_b, 1)
+    in_a = rng.hypergeometric(pooled, n_a + n_b - pooled, n_a, size=(size, len(n_a)))
+    return in_a / n_a_safe - (pooled - in_a) / n_b_safe
+
+
+def _heterogeneity_statistic(successes: np.ndarray, n: np.ndarray) -> np.ndarray:
+    # Chi-square statistic of a 2 x K table, along the last axis
+    pooled = successes.sum(axis=-1, keepdims=True) / n.sum()
+    variance = n * pooled * (1 - pooled)
+    return np.where(variance > 0, (successes - n * pooled) ** 2 / np.where(variance > 0, variance, 1), 0).sum(axis=-1)
+
+
+def _heterogeneity_chunk(task) -> np.ndarray:
+    n, total_successes, size, seed = task
+    rng = np.random.default_rng(seed)
+    remaining_good = np.full(size, total_successes)
+    remaining_bad = np.full(size, n.sum() - total_successes)
+    draws = np.empty((size, len(n)), dtype=np.int64)
+    # Dealing the shuffled pool into the groups one after another
+    for k, n_k in enumerate(n[:-1]):
+        draws[:, k] = rng.hypergeometric(remaining_good, remaining_bad, n_k) if n_k else 0
+        remaining_bad -= n_k - draws[:, k]
+        remaining_good -= draws[:, k]
+    draws[:, -1] = remaining_good
+    return _heterogeneity_statistic(draws, n)
+
+
+def bootstrap_ci(
+        counts: pd.DataFrame,
+        by: Sequence[str] = GROUP_COLUMNS,
+        resamples: int = DEFAULT_RESAMPLES,
+        confidence: float = 0.95,
+        seed: Optional[int] = None,
+        workers: int = 1
+        ) -> pd.DataFrame:
+    """
+    Percentile bootstrap CIs of the accuracy of every group, all groups in one pass.
+    Args:
+        counts: Rows with the `by` columns plus n (valid verdicts) and successes,
+            e.g. ResultsAggregator.snapshot(); rows sharing a group are summed.
+    Returns:
+        pd.DataFrame: `by` columns, n, accuracy, ci_low, ci_high.
+    """
+    grouped = counts.groupby(list(by), as_index=False)[["n", "successes"]].sum()
+    grouped = grouped[grouped["n"] > 0].reset_index(drop=True)
+    n = grouped["n"].to_numpy(dtype=np.int64)
+    successes = grouped["successes"].to_numpy(dtype=np.int64)
+    samples = _run(_bootstrap_chunk, [(n, successes, size, child) for size, child in _chunks(resamples, seed)], workers)
+
+    alpha = (1 - confidence) / 2
+    grouped["accuracy"] = successes / n
+    grouped["ci_low"], grouped["ci_high"] = np.quantile(samples, [alpha, 1 - alpha], axis=0)
+    return grouped[list(by) + ["n", "accuracy", "ci_low", "ci_high"]]
+
+
+def permutation_tests(
+        pairs: Sequence[Tuple[Tuple[int, int], Tuple[int, int]]],
+        resamples: int = DEFAULT_RESAMPLES,
+        confidence: float = 0.95,
+        seed: Optional[int] = None,
+        workers: int = 1
+        ) -> pd.DataFrame:
+    """
+    Two-sided permutation tests of equal accuracy for several pairs of groups at once, with a
+    bootstrap CI of each difference.
+    Args:
+        pairs: ((n_a, successes_a), (n_b, successes_b)) per comparison.
+    Returns:
+        pd.DataFrame: One row per pair: accuracy_a, accuracy_b, difference (a - b), ci_low,
+        ci_high and p_value.
+    """
+    (n_a, s_a), (n_b, s_b) = (np.array(side, dtype=np.int64).T for side in zip(*pairs))
+    observed = s_a / np.maximum(n_a, 1) - s_b / np.maximum(n_b, 1)
+    chunks = _chunks(resamples, seed)
+    null = _run(_permutation_chunk, [(n_a, n_b, s_a + s_b, size, child) for size, child in chunks], workers)
+    # Independent draws for the CI so the seed doesn't tie it to the null distribution
+    n_ab, s_ab = np.concatenate([n_a, n_b]), np.concatenate([s_a, s_b])
+    boot = _run(_bootstrap_chunk, [(n_ab, s_ab, size, child) for size, child in _chunks(resamples, None if seed is None else seed + 1)], workers)
+    differences = boot[:, :len(n_a)] - boot[:, len(n_a):]
+
+    alpha = (1 - confidence) / 2
+    ci_low, ci_high = np.quantile(differences, [alpha, 1 - alpha], axis=0)
+    # Small tolerance so ties with the observed statistic count as "as extreme"
+    extreme = (np.abs(null) >= np.abs(observed) - 1e-12).sum(axis=0)
+    return pd.DataFrame({
+        "accuracy_a": s_a / np.maximum(n_a, 1),
+        "accuracy_b": s_b / np.maximum(n_b, 1),
+        "difference": observed,
+        "ci_low": ci_low,
+        "ci_high": ci_high,
+        "p_value": (extreme + 1) / (resamples + 1),
+    })
+
+
+def heterogeneity_test(
+        n: Sequence[int],
+        successes: Sequence[int],
+        resamples: int = DEFAULT_RESAMPLES,
+        seed: Optional[int] = None,
+        workers: int = 1
+        ) -> dict:
+    """
+    Permutation test that accuracy is the same in every group (e.g. across insert positions),
+    using the chi-square statistic of the 2 x K table.
+    Returns:
+        dict: statistic, p_value.
+    """
+    n = np.asarray(n, dtype=np.int64)
+    successes = np.asarray(successes, dtype=np.int64)
+    observed = _heterogeneity_statistic(successes, n)
+    tasks = [(n, int(successes.sum()), size, child) for size, child in _chunks(resamples, seed)]
+    null = _run(_heterogeneity_chunk, tasks, workers)
+    extreme = int((null >= observed - 1e-9).sum())
+    return {"statistic": float(observed), "p_value": (extreme + 1) / (resamples + 1)}
+
+
+def add_resampling_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES, help="Bootstrap/permutation resamples.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible intervals and p-values.")
+    parser.add_argument("--workers", type=int, default=1, help="Processes to spread the resamples over.")
@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Union
+
+
+class CacheMiss(KeyError):
+    """Raised in replay mode when a request has no cached response."""
+
+
+class ResponseCache:
+    """
+    On-disk cache of chat completions in SQLite, keyed by a hash of (model, messages, gen_params).
+
+    Modes:
+        readwrite: serve hits, store new responses.
+        replay:    serve hits only and raise CacheMiss otherwise, for offline reanalysis.
+
+    Entries are evicted by age (`max_age_days`) and then least-recently-used first
+    until the cache fits `max_entries` / `max_bytes`, when the cache is opened and whenever
+    a new response takes it over either limit.
+    """
+    def __init__(
+            self,
+            path: str = "./data/cache/responses.sqlite",
+            mode: str = "readwrite",
+            max_entries: Optional[int] = None,
+            max_bytes: Optional[int] = None,
+            max_age_days: Optional[float] = None
+            ):
+        if mode not in ("readwrite", "replay"):
+            raise ValueError(f"Invalid cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, "
+            "created REAL, last_access REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+        self.conn.commit()
+        # Running totals, so a put only triggers eviction when a limit is exceeded
+        self.entries, self.bytes = 0, 0
+        if not self.replay:
+            self.evict()
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(model: str, messages: list, gen_params: dict) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "gen_params": gen_params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.replay:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        if self.replay:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now)
+            )
+            self.conn.commit()
+            # A replaced key is counted twice; evict() recounts exactly
+            self.entries += 1
+            self.bytes += len(response.encode("utf-8"))
+            over_limit = (self.max_entries is not None and self.entries > self.max_entries) \
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        if over_limit:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                self.conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+            if self.max_entries is not None:
+                self.conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            if self.max_bytes is not None:
+                total = 0
+                stale = []
+                for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access DESC"):
+                    total += size
+                    if total > self.max_bytes:
+                        stale.append((key,))
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+            self.conn.commit()
+            self.entries, self.bytes = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+    def get_or_create(self, model: str, messages: list, gen_params: dict, create: Callable[[], Union[str, None]]) -> Union[str, None]:
+        """
+        Return the cached response for this request or call `create()` and store its result.
+        Failed calls (None) are not cached.
+        """
+        key = self.make_key(model, messages, gen_params)
+        response = self.get(key)
+        if response is not None:
+            return response
+        if self.replay:
+            raise CacheMiss(key)
+        response = create()
+        if response is not None:
+            self.put(key, model, response)
+        return response
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "mb": size / 1024 ** 2,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def add_cache_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--cache_path", type=str, default=None,
+                        help="SQLite response cache shared across runs (disabled when omitted).")
+    parser.add_argument("--cache_mode", type=str, default="readwrite", choices=["readwrite", "replay"],
+                        help="'replay' only serves cached responses and never calls the API.")
+    parser.add_argument("--cache_max_mb", type=float, default=None, help="Evict least recently used responses above this size.")
+    parser.add_argument("--cache_max_age_days", type=float, default=None, help="Evict responses older than this.")
+
+def cache_from_args(args: argparse.Namespace) -> Optional[ResponseCache]:
+    if not args.cache_path:
+        return None
+    return ResponseCache(
+        path=args.cache_path,
+        mode=args.cache_mode,
+        max_bytes=int(args.cache_max_mb * 1024 ** 2) if args.cache_max_mb else None,
+        max_age_days=args.cache_max_age_days
+    )
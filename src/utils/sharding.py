@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+from typing import List, Tuple
+
+Shard = Tuple[int, int]
+
+
+def parse_shard(spec: str) -> Shard:
+    """
+    Parse 'i/N' (0-based shard i of N) for argparse.
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{spec}', expected i/N such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{spec}': i must be in [0, N)")
+    return index, count
+
+
+def in_shard(idx: int, shard: Shard) -> bool:
+    # Round-robin over the grid so every shard gets the same mix of depths and questions
+    index, count = shard
+    return idx % count == index
+
+
+def shard_size(grid_size: int, shard: Shard) -> int:
+    index, count = shard
+    return len(range(index, grid_size, count))
+
+
+def shard_output_path(output_path: str, shard: Shard) -> str:
+    stem, ext = os.path.splitext(output_path)
+    index, count = shard
+    return f"{stem}.shard-{index}-of-{count}{ext}"
+
+
+def shard_paths(output_path: str, count: int) -> List[str]:
+    return [shard_output_path(output_path, (index, count)) for index in range(count)]
+
+
+def manifest_path(shard_path: str) -> str:
+    return os.path.splitext(shard_path)[0] + ".manifest.json"
+
+
+def write_manifest(shard_path: str, manifest: dict):
+    """
+    Record what a shard is expected to contain, so merging can check completeness
+    without rebuilding the grid.
+    """
+    with open(manifest_path(shard_path), 'w') as o_file:
+        json.dump(manifest, o_file, indent=2)
+
+
+def read_manifest(shard_path: str) -> dict:
+    with open(manifest_path(shard_path), 'r') as i_file:
+        return json.load(i_file)
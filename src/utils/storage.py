@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from utils.checkpoint import read_jsonl_rows
+
+# Large free-text columns live in a separate, more heavily compressed file
+TEXT_COLUMNS = ("output", "mal_question", "generation", "prompt", "audit_response")
+# Low-cardinality string columns stored dictionary-encoded
+DICTIONARY_COLUMNS = ("mal_q_id", "id", "model", "system_prompt", "decided_by", "response")
+# Row number shared by both files so text can be joined back after projection
+ROW_COLUMN = "_row"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet storage needs pyarrow: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def columnar_paths(path: str) -> Tuple[str, str]:
+    """
+    Parquet files for a JSONL output: `<stem>.parquet` (compact columns) and
+    `<stem>.text.parquet` (text columns).
+    """
+    stem = os.path.splitext(path)[0]
+    if stem.endswith(".text"):
+        stem = stem[:-len(".text")]
+    return f"{stem}.parquet", f"{stem}.text.parquet"
+
+
+def write_columnar(rows: Iterable[dict], path: str, compression: str = "zstd", text_compression_level: int = 9):
+    """
+    Write rows as two Parquet files next to `path`. Dict-valued cells (mal_question) are
+    stored as JSON strings and decoded again by read_columnar.
+    """
+    pa, pq = _require_pyarrow()
+    df = pd.DataFrame(list(rows))
+    df[ROW_COLUMN] = range(len(df))
+    for column in df.columns:
+        if df[column].map(lambda value: isinstance(value, (dict, list))).any():
+            df[column] = df[column].map(lambda value: json.dumps(value) if isinstance(value, (dict, list)) else value)
+
+    text_columns = [column for column in df.columns if column in TEXT_COLUMNS]
+    compact = pa.Table.from_pandas(df.drop(columns=text_columns), preserve_index=False)
+    for name in DICTIONARY_COLUMNS:
+        if name not in compact.column_names:
+            continue
+        field_type = compact.schema.field(name).type
+        if pa.types.is_string(field_type) or pa.types.is_large_string(field_type):
+            compact = compact.set_column(
+                compact.column_names.index(name), name, compact.column(name).dictionary_encode()
+            )
+    text = pa.Table.from_pandas(df[[ROW_COLUMN] + text_columns], preserve_index=False)
+
+    table_path, text_path = columnar_paths(path)
+    os.makedirs(os.path.dirname(table_path) or ".", exist_ok=True)
+    pq.write_table(compact, table_path, compression=compression)
+    pq.write_table(
+        text, text_path, compression=compression, compression_level=text_compression_level, use_dictionary=False
+    )
+
+
+def read_columnar(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Read only `columns` (all when None); the text file is opened only if a text column is requested.
+    Requested columns that don't exist are skipped.
+    """
+    _, pq = _require_pyarrow()
+    table_path, text_path = columnar_paths(path)
+    compact_names = [name for name in pq.read_schema(table_path).names if name != ROW_COLUMN]
+    text_names = []
+    if os.path.exists(text_path):
+        text_names = [name for name in pq.read_schema(text_path).names if name != ROW_COLUMN]
+    wanted = list(columns) if columns is not None else compact_names + text_names
+    compact_wanted = [name for name in wanted if name in compact_names]
+    text_wanted = [name for name in wanted if name in text_names]
+
+    df = pq.read_table(table_path, columns=compact_wanted + [ROW_COLUMN]).to_pandas()
+    if text_wanted:
+        text = pq.read_table(text_path, columns=text_wanted + [ROW_COLUMN]).to_pandas()
+        df = df.merge(text, on=ROW_COLUMN, how="left")
+    if "mal_question" in df.columns:
+        df["mal_question"] = df["mal_question"].map(
+            lambda value: json.loads(value) if isinstance(value, str) and value.startswith("{") else value
+        )
+    return df.drop(columns=[ROW_COLUMN])[[name for name in wanted if name in df.columns]]
+
+
+def has_columnar(path: str) -> bool:
+    """
+    True if up-to-date Parquet files exist for `path` (not older than the JSONL, when there is one).
+    """
+    table_path, _ = columnar_paths(path)
+    if not os.path.exists(table_path):
+        return False
+    jsonl_path = os.path.splitext(table_path)[0] + ".jsonl"
+    return not os.path.exists(jsonl_path) or os.path.getmtime(table_path) >= os.path.getmtime(jsonl_path)
+
+
+def load_table(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Load an output file, from Parquet with column projection when available and pyarrow is
+    installed, otherwise from the JSONL. Missing requested columns are skipped.
+    """
+    if path.endswith(".parquet") or has_columnar(path):
+        try:
+            return read_columnar(path, columns)
+        except ImportError:
+            if path.endswith(".parquet"):
+                raise
+    df = pd.read_json(path, lines=True)
+    if columns is not None:
+        df = df[[name for name in columns if name in df.columns]]
+    return df
+
+
+def export_columnar(jsonl_path: str) -> List[str]:
+    """
+    Convert a finalized JSONL output to the Parquet pair.
+    Returns:
+        list: The written paths.
+    """
+    write_columnar(read_jsonl_rows(jsonl_path), jsonl_path)
+    return list(columnar_paths(jsonl_path))
+
+
+def add_storage_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--storage", type=str, default="jsonl", choices=["jsonl", "parquet"],
+                        help="'parquet' also writes <stem>.parquet + <stem>.text.parquet at the end of the run "
+                             "(needs pyarrow); the JSONL stays as the resumable checkpoint.")
@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def load_pricing(path: str = "resources/model_pricing.json") -> dict:
+    """
+    Per-model prices in USD per 1M tokens; models without an entry are reported without cost.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as i_file:
+        return {model: rates for model, rates in json.load(i_file).items() if not model.startswith("_")}
+
+
+def request_cost(
+        pricing: dict, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int], cached_tokens: Optional[int] = 0
+        ) -> Optional[float]:
+    rates = pricing.get(model)
+    if rates is None or prompt_tokens is None:
+        return None
+    cached = cached_tokens or 0
+    return (
+        (prompt_tokens - cached) * rates["input"]
+        + cached * rates.get("cached_input", rates["input"])
+        + (completion_tokens or 0) * rates["output"]
+    ) / 1e6
+
+
+def latency_quantiles(latencies: Iterable[float]) -> Dict[str, float]:
+    # Imported here so runs without telemetry never load numpy
+    import numpy as np
+    latencies = np.asarray([latency for latency in latencies if latency is not None], dtype=float)
+    if latencies.size == 0:
+        return {}
+    values = np.percentile(latencies, [q * 100 for q in QUANTILES])
+    report = {f"p{int(q * 100)}": float(value) for q, value in zip(QUANTILES, values)}
+    report["mean"] = float(latencies.mean())
+    report["sum"] = float(latencies.sum())
+    return report
+
+
+def _aggregate(records: List[dict]) -> dict:
+    costs = [record["cost"] for record in records if record["cost"] is not None]
+    return {
+        "requests": len(records),
+        "errors": sum(record["status"] != "ok" for record in records),
+        "retries": sum(record["retries"] for record in records),
+        "prompt_tokens": sum(record["prompt_tokens"] or 0 for record in records),
+        "completion_tokens": sum(record["completion_tokens"] or 0 for record in records),
+        "cached_tokens": sum(record["cached_tokens"] or 0 for record in records),
+        "cost_usd": sum(costs) if costs else None,
+        "latency": latency_quantiles(record["latency"] for record in records if record["status"] == "ok"),
+    }
+
+
+def _group(records: List[dict], key) -> Dict[str, dict]:
+    groups: Dict[object, List[dict]] = {}
+    for record in records:
+        value = key(record)
+        if value is not None:
+            groups.setdefault(value, []).append(record)
+    return {str(value): _aggregate(groups[value]) for value in sorted(groups)}
+
+
+def _prom_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Telemetry:
+    """
+    Thread-safe per-request recorder for latency, tokens, retries and cost.
+
+    Clients call record() once per logical request (retries included). Callers attach
+    labels such as insert_position to every request made on the current thread with
+    `with telemetry.labels(...)`, so clients don't need to know about the experiment grid.
+    Context length is bucketed by `context_bucket` tokens for the latency breakdown.
+    """
+    def __init__(self, name: str = "run", pricing_path: str = "resources/model_pricing.json", context_bucket: int = 8192):
+        self.name = name
+        self.pricing = load_pricing(pricing_path)
+        self.context_bucket = context_bucket
+        self.records: List[dict] = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+
+    @contextlib.contextmanager
+    def labels(self, **labels):
+        previous = getattr(self.local, "labels", {})
+        self.local.labels = {**previous, **labels}
+        try:
+            yield
+        finally:
+            self.local.labels = previous
+
+    def record(
+            self,
+            model: str,
+            latency: Optional[float],
+            prompt_tokens: Optional[int] = None,
+            completion_tokens: Optional[int] = None,
+            cached_tokens: Optional[int] = None,
+            retries: int = 0,
+            status: str = "ok",
+            **fields
+            ) -> dict:
+        record = {
+            "model": model,
+            "latency": latency,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "retries": retries,
+            "status": status,
+            "cost": request_cost(self.pricing, model, prompt_tokens, completion_tokens, cached_tokens),
+            **getattr(self.local, "labels", {}),
+            **fields,
+        }
+        with self.lock:
+            self.records.append(record)
+        return record
+
+    def _context_bucket(self, record: dict) -> Optional[int]:
+        tokens = record.get("context_tokens", record["prompt_tokens"])
+        if tokens is None:
+            return None
+        return tokens // self.context_bucket * self.context_bucket
+
+    def summary(self) -> dict:
+        with self.lock:
+            records = list(self.records)
+        wall_seconds = time.time() - self.started
+        summary = {
+            "name": self.name,
+            "started": self.started,
+            "wall_seconds": wall_seconds,
+            **_aggregate(records),
+        }
+        summary["requests_per_second"] = len(records) / wall_seconds if wall_seconds > 0 else None
+        summary["by_model"] = _group(records, lambda record: record["model"])
+        summary["by_insert_position"] = _group(records, lambda record: record.get("insert_position"))
+        summary["context_bucket_tokens"] = self.context_bucket
+        summary["by_context_tokens"] = _group(records, self._context_bucket)
+        return summary
+
+    def prometheus_text(self, summary: Optional[dict] = None, prefix: str = "lcm") -> str:
+        """
+        Render the summary in the Prometheus text exposition format (e.g. for the node_exporter
+        textfile collector).
+        """
+        summary = summary or self.summary()
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: Iterable[tuple]):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for suffix, labels, value in samples:
+                if value is not None:
+                    lines.append(f"{prefix}_{name}{suffix}{_prom_labels(labels)} {value}")
+
+        def quantile_samples(latency: dict, labels: dict):
+            for q in QUANTILES:
+                key = f"p{int(q * 100)}"
+                if key in latency:
+                    yield "", {**labels, "quantile": str(q)}, latency[key]
+
+        by_model = summary["by_model"]
+        metric("requests_total", "counter", "Completed requests by status.", [
+            ("", {"run": self.name, "model": model, "status": status}, value)
+            for model, stats in by_model.items()
+            for status, value in (("ok", stats["requests"] - stats["errors"]), ("error", stats["errors"]))
+        ])
+        metric("retries_total", "counter", "Retried attempts.", [
+            ("", {"run": self.name, "model": model}, stats["retries"]) for model, stats in by_model.items()
+        ])
+        metric("tokens_total", "counter", "Tokens by kind.", [
+            ("", {"run": self.name, "model": model, "kind": kind}, stats[f"{kind}_tokens"])
+            for model, stats in by_model.items() for kind in ("prompt", "completion", "cached")
+        ])
+        metric("cost_usd_total", "counter", "Estimated cost in USD.", [
+            ("", {"run": self.name, "model": model}, stats["cost_usd"]) for model, stats in by_model.items()
+        ])
+        samples = []
+        for model, stats in by_model.items():
+            labels = {"run": self.name, "model": model}
+            samples.extend(quantile_samples(stats["latency"], labels))
+            samples.append(("_sum", labels, stats["latency"].get("sum", 0.0)))
+            samples.append(("_count", labels, stats["requests"] - stats["errors"]))
+        metric("request_latency_seconds", "summary", "Latency of successful requests.", samples)
+        metric("request_latency_by_position_seconds", "gauge", "Latency quantiles by insert position.", [
+            sample for position, stats in summary["by_insert_position"].items()
+            for sample in quantile_samples(stats["latency"], {"run": self.name, "insert_position": position})
+        ])
+        metric("request_latency_by_context_seconds", "gauge", "Latency quantiles by context length bucket (tokens).", [
+            sample for bucket, stats in summary["by_context_tokens"].items()
+            for sample in quantile_samples(stats["latency"], {"run": self.name, "context_tokens": bucket})
+        ])
+        metric("requests_per_second", "gauge", "Average request throughput over the run.", [
+            ("", {"run": self.name}, summary["requests_per_second"])
+        ])
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str) -> tuple:
+        """
+        Write `<name>.telemetry.json` and `<name>.prom` to `directory`.
+        Returns:
+            tuple: The two paths.
+        """
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        json_path = os.path.join(directory, f"{self.name}.telemetry.json")
+        prom_path = os.path.join(directory, f"{self.name}.prom")
+        with open(json_path, 'w') as o_file:
+            json.dump(summary, o_file, indent=2)
+        with open(prom_path, 'w') as o_file:
+            o_file.write(self.prometheus_text(summary))
+        return json_path, prom_path
+
+
+def add_telemetry_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--telemetry_dir", type=str, default=None,
+                        help="Write the run's latency/token/cost summary (JSON and Prometheus) here, e.g. ./data/telemetry (off when omitted).")
+
+def telemetry_from_args(args: argparse.Namespace, output_path: str) -> Optional[Telemetry]:
+    if not args.telemetry_dir:
+        return None
+    return Telemetry(name=os.path.splitext(os.path.basename(output_path))[0])
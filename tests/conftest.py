@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Scripts and utils are imported the way the entry points see them (src/ on the path)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
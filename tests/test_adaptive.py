@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from utils.adaptive import AdaptivePositionSearch
+
+POSITIONS = list(range(0, 1000, 10))
+
+
+def run(search, verdict):
+    while True:
+        proposals = search.propose()
+        if not proposals:
+            return
+        for position in proposals:
+            search.record(position, verdict(position))
+
+
+@pytest.mark.parametrize("threshold", [15, 370, 640, 985])
+def test_converges_on_a_step_function(threshold):
+    search = AdaptivePositionSearch(POSITIONS, budget=15, coarse_points=5)
+    run(search, lambda position: float(position >= threshold))
+    summary = search.summary()
+    # The threshold is bracketed by neighbouring candidates with far fewer calls than the grid
+    [[low, high]] = summary["transitions"]
+    assert low < threshold <= high and high - low == 10
+    assert summary["unresolved"] == []
+    assert search.calls <= 15
+    assert search.curve().tolist() == [float(position >= threshold) for position in POSITIONS]
+
+
+def test_failed_positions_are_retried():
+    failures = {250: 1, 500: 1}
+
+    def verdict(position):
+        if failures.get(position):
+            failures[position] -= 1
+            return None
+        return float(position >= 370)
+
+    search = AdaptivePositionSearch(POSITIONS, budget=20, coarse_points=3, retries=1)
+    run(search, verdict)
+    assert search.summary()["transitions"] == [[360, 370]]
+    assert search.summary()["failed"] == []
+
+
+def test_unresolved_transitions_are_reported():
+    search = AdaptivePositionSearch(POSITIONS, budget=20, coarse_points=3, retries=1)
+    # Coarse points 0, 500 and 990; the midpoint of the transition never gets a verdict
+    run(search, lambda position: None if position == 250 else float(position >= 370))
+    summary = search.summary()
+    assert summary["unresolved"] == [[0, 500]]
+    assert summary["failed"] == [250]
+    # The coarse grid, then the failed midpoint and its single retry
+    assert search.calls == 5
+
+
+def test_positions_off_the_grid_are_ignored():
+    search = AdaptivePositionSearch(POSITIONS, budget=5)
+    search.record(5, 1.0)
+    assert search.calls == 0 and search.summary()["observed"] == {}
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from utils.aggregator import ResultsAggregator
+
+
+def write_results(path, verdicts, mode='w'):
+    with open(path, mode) as o_file:
+        for i, verdict in enumerate(verdicts):
+            row = {"idx": i, "mal_q_id": f"q{i}", "insert_position": 0, "response": verdict,
+                   "generation": "text " * 50, "model": "gpt-4o-mini"}
+            o_file.write(json.dumps(row) + "\n")
+
+
+def counts(aggregator):
+    row = aggregator.snapshot().iloc[0]
+    return int(row["n"]), int(row["successes"]), int(row["invalid"])
+
+
+def test_appended_rows_are_counted_once(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write_results(path, ["1", "0"])
+    aggregator = ResultsAggregator({"exp": path}, state_path=str(tmp_path / "state.json"))
+    assert aggregator.refresh() == 2
+    write_results(path, ["1", "oops"], mode='a')
+    # A fresh aggregator resumes from the saved offset
+    aggregator = ResultsAggregator({"exp": path}, state_path=str(tmp_path / "state.json"))
+    assert aggregator.refresh() == 2
+    assert counts(aggregator) == (3, 2, 1)
+
+
+def test_file_rewritten_in_place_is_recounted(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write_results(path, ["1", "1", "1"])
+    aggregator = ResultsAggregator({"exp": path})
+    aggregator.refresh()
+    # Same inode, same size, different verdicts
+    write_results(path, ["0", "0", "0"], mode='r+')
+    aggregator.refresh()
+    assert counts(aggregator) == (3, 0, 0)
+
+
+def test_columnar_copy_is_used_for_a_full_count(tmp_path):
+    pytest.importorskip("pyarrow")
+    from utils.storage import export_columnar
+    path = str(tmp_path / "results.jsonl")
+    write_results(path, ["1", "0", "1", None])
+    export_columnar(path)
+    aggregator = ResultsAggregator({"exp": path})
+    assert aggregator.refresh() == 4
+    assert counts(aggregator) == (3, 2, 1)
+    write_results(path, ["1"], mode='a')
+    assert aggregator.refresh() == 1
+    assert counts(aggregator) == (4, 3, 1)
@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from utils.batch import LocalBatchBackend, batch_request, load_batch_state, run_batch, write_batch_files
+
+
+def requests(count, chars=3000):
+    for i in range(count):
+        messages = [{"role": "user", "content": f"{i:04d}" + "x" * chars}]
+        yield batch_request(f"q{i}::0", "gpt-4o-mini", messages, {"max_tokens": 100})
+
+
+class QueueBackend(LocalBatchBackend):
+    """
+    Local backend whose batches take one extra poll to finish; records the enqueued tokens
+    seen at every submission and can fail after a number of submissions.
+    """
+    def __init__(self, batch_dir, tokens, fail_after=None):
+        super().__init__(batch_dir)
+        self.tokens = tokens
+        self.fail_after = fail_after
+        self.in_flight = {}
+        self.peak = 0
+
+    def submit(self, requests_path):
+        if self.fail_after is not None and len(self.in_flight) >= self.fail_after:
+            raise ConnectionError("submit failed")
+        batch_id = super().submit(requests_path)
+        self.in_flight[batch_id] = self.tokens[requests_path]
+        self.peak = max(self.peak, sum(self.in_flight.values()))
+        return batch_id
+
+    def status(self, batch_id):
+        if self.in_flight.get(batch_id) is not None and not getattr(self, "polled_" + batch_id, False):
+            setattr(self, "polled_" + batch_id, True)
+            return {"status": "in_progress"}
+        self.in_flight[batch_id] = 0
+        return super().status(batch_id)
+
+
+def test_parts_respect_size_and_token_limits(tmp_path):
+    parts = write_batch_files(str(tmp_path / "run.requests.jsonl"), requests(40), max_mb=0.03, max_tokens=5000)
+    assert len(parts) > 1
+    assert sum(part["requests"] for part in parts) == 40
+    for part in parts:
+        assert part["bytes"] <= 0.03 * 1024 * 1024 and part["tokens"] <= 5000
+        assert os.path.getsize(part["path"]) == part["bytes"]
+
+
+def test_run_batch_keeps_queue_under_cap_and_resumes(tmp_path):
+    requests_path, state_path = str(tmp_path / "run.requests.jsonl"), str(tmp_path / "run.batch_state.json")
+    parts = write_batch_files(requests_path, requests(30), max_tokens=3000)
+    tokens = {part["path"]: part["tokens"] for part in parts}
+
+    backend = QueueBackend(str(tmp_path / "batches"), tokens, fail_after=2)
+    with pytest.raises(ConnectionError):
+        run_batch(backend, parts, state_path, max_tokens=6000, poll_interval=0, log=lambda message: None)
+    # Every batch submitted before the failure is recorded for reattaching
+    state = load_batch_state(state_path)
+    assert sum(part["batch_id"] is not None for part in state["parts"]) == 2
+
+    backend.fail_after = None
+    results = run_batch(backend, [], state_path, max_tokens=6000, poll_interval=0, log=lambda message: None)
+    assert sorted(results) == sorted(f"q{i}::0" for i in range(30))
+    assert backend.peak <= 6000
+    assert not os.path.exists(state_path)
+    with open(parts[0]["path"]) as i_file:
+        assert json.loads(i_file.readline())["custom_id"] == "q0::0"
@@ -0,0 +1,50 @@
+import json
+
+from utils.checkpoint import CheckpointWriter, read_jsonl_rows
+
+
+def key(row):
+    return row["cell"]
+
+
+def complete(row):
+    return row.get("output") is not None
+
+
+def test_fresh_run_truncates(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with open(path, 'w') as o_file:
+        o_file.write(json.dumps({"cell": 1, "output": "old"}) + "\n")
+    writer = CheckpointWriter(path, key_fn=key)
+    writer.write({"cell": 2, "output": "new"})
+    writer.close()
+    assert read_jsonl_rows(path) == [{"cell": 2, "output": "new"}]
+
+
+def test_resume_keeps_completed_rows_and_drops_failed_and_partial(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with open(path, 'w') as o_file:
+        o_file.write(json.dumps({"cell": 1, "output": "a"}) + "\n")
+        o_file.write(json.dumps({"cell": 2, "output": None}) + "\n")
+        o_file.write(json.dumps({"cell": 1, "output": "a2"}) + "\n")
+        o_file.write('{"cell": 3, "outp')  # killed mid-write
+
+    writer = CheckpointWriter(path, key_fn=key, resume=True, is_complete=complete)
+    assert writer.is_done(1) and not writer.is_done(2) and not writer.is_done(3)
+    # Compacted on open: one row per key, the last one wins
+    assert read_jsonl_rows(path) == [{"cell": 1, "output": "a2"}]
+
+    writer.write({"cell": 3, "output": "c"})
+    writer.write({"cell": 2, "output": "b"})
+    writer.finalize(sort_key=key)
+    assert [row["output"] for row in read_jsonl_rows(path)] == ["a2", "b", "c"]
+
+
+def test_buffered_rows_are_flushed_on_finalize(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    writer = CheckpointWriter(path, key_fn=key, flush_every=100)
+    for cell in range(5):
+        writer.write({"cell": cell, "output": str(cell)})
+    assert read_jsonl_rows(path) == []
+    writer.finalize()
+    assert len(read_jsonl_rows(path)) == 5
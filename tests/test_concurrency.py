@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+
+import pytest
+
+from utils.concurrency import RateLimiter, parse_duration, run_ordered
+
+
+def test_run_ordered_yields_in_input_order():
+    def slow_square(x):
+        time.sleep(random.Random(x).uniform(0, 0.01))
+        return x * x
+
+    results = list(run_ordered(range(50), slow_square, max_workers=8))
+    assert results == [(x, x * x) for x in range(50)]
+
+
+def test_run_ordered_bounds_items_pulled_ahead():
+    pulled = []
+
+    def items():
+        for x in range(40):
+            pulled.append(x)
+            yield x
+
+    for x, _ in run_ordered(items(), lambda x: x, max_workers=3, max_in_flight=5):
+        # Never more than max_in_flight items pulled beyond the one being yielded
+        assert len(pulled) - x <= 5
+
+
+def test_run_ordered_propagates_errors():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError):
+        list(run_ordered(range(10), fail_on_three, max_workers=4))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1s", 1.0),
+    ("250ms", 0.25),
+    ("6m0s", 360.0),
+    ("1h2m3s", 3723.0),
+    ("1.5", 1.5),
+    (2, 2.0),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == expected
+
+
+def test_rate_limiter_bounds_concurrency():
+    limiter = RateLimiter(max_concurrency=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work(_):
+        limiter.acquire()
+        try:
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.005)
+            with lock:
+                active[0] -= 1
+        finally:
+            limiter.release()
+
+    list(run_ordered(range(20), work, max_workers=6))
+    assert peak[0] <= 2
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+pytest.importorskip("tiktoken")
+
+from utils.ClassAPI import DataProcessor
+
+
+@pytest.fixture
+def processor(tmp_path):
+    benign = tmp_path / "benign.jsonl"
+    with open(benign, 'w') as o_file:
+        for i in range(12):
+            # Every fourth entry repeats a key, as the cycled benign file does
+            o_file.write(json.dumps({"question": f"Question {i}?", "uuid": f"u{i % 4 if i % 4 == 3 else i}"}) + "\n")
+    malicious = tmp_path / "malicious.jsonl"
+    with open(malicious, 'w') as o_file:
+        for i in range(3):
+            o_file.write(json.dumps({"id": f"q{i}", "question": f"Harmful {i}?"}) + "\n")
+    processor = DataProcessor()
+    processor.load_benign_questions(str(benign))
+    processor.load_malicious_questions(str(malicious), prompt_key="question", num_questions="all")
+    return processor
+
+
+def test_lazy_cells_match_the_materialized_list(processor):
+    cells = list(processor.iter_cells(5))
+    assert len(cells) == processor.count_prompts(5) == 3 * len(range(0, 12, 5))
+    assert [(mal_q_id, position) for mal_q_id, position, _ in cells][:3] == [("q0", 0), ("q0", 5), ("q0", 10)]
+
+    processor.generate_list_of_prompts(5)
+    assert [prompt for prompt, *_ in processor.prompt_list] == [
+        processor.generate_prompt(position, question) for _, position, question in cells
+    ]
+
+
+def test_fragment_prompts_match_the_dict_reference(processor):
+    question = processor.malicious_questions[0]
+    for position in range(-2, 15):
+        assert processor.generate_prompt(position, question) == processor._generate_prompt_from_dict(position, question)
+
+
+def test_distinct_before_counts_unique_keys(processor):
+    assert [processor.distinct_before(position) for position in (0, 3, 4, 12)] == [0, 3, 4, 10]
+    processor.clear_caches()
+    assert processor.distinct_before(12) == 10
@@ -0,0 +1,18 @@
+from utils.dedup import dedup_report, group_duplicates, normalize_generation
+
+
+def test_normalization_ignores_uuids_and_whitespace():
+    a = "I can't help with 123e4567-e89b-12d3-a456-426614174000.\n\nSorry."
+    b = "I can't  help with 9f1c2d3e-0000-4abc-8def-0123456789ab. Sorry. "
+    assert normalize_generation(a) == normalize_generation(b)
+
+
+def test_groups_keep_first_seen_order():
+    hashes, groups = group_duplicates(["No.", "Yes", "  No. ", "Maybe", "Yes"])
+    assert list(groups.values()) == [[0, 2], [1, 4], [3]]
+    assert hashes[0] == hashes[2] != hashes[1]
+
+
+def test_report():
+    assert dedup_report(10, 4) == "Dedup: 10 rows -> 4 unique generations (ratio 2.50x, 6 judge calls saved, 60.0%)"
+    assert "0 rows" in dedup_report(0, 0)
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+
+from llm_as_judge import judge_key, load_generations, result_row, row_key
+
+
+def write_generations(path, idxs, mode='w'):
+    with open(path, mode) as o_file:
+        for idx in idxs:
+            o_file.write(json.dumps({"idx": idx, "id": f"q{idx}", "prompt": "?", "output": f"out {idx}"}) + "\n")
+
+
+def keys(path):
+    return [row_key(row) for row in load_generations(path).itertuples()]
+
+
+def test_appended_rerun_keeps_earlier_keys(tmp_path):
+    path = str(tmp_path / "math.jsonl")
+    write_generations(path, [0, 0, 1])
+    before = keys(path)
+    assert len(set(before)) == 3
+    write_generations(path, [0, 1, 2], mode='a')
+    after = keys(path)
+    assert after[:3] == before
+    assert len(set(after)) == 6
+
+
+def test_result_rows_resume_on_the_same_key(tmp_path):
+    path = str(tmp_path / "math.jsonl")
+    write_generations(path, [0, 0])
+    for row in load_generations(path).itertuples():
+        # Written rows and the rows they were judged from share a key
+        assert judge_key(json.loads(json.dumps(result_row(row, "1", "llm")))) == row_key(row)
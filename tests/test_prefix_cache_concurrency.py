@@ -0,0 +1,74 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from utils.hf_models import HuggingFaceProcessor
+
+UUID = "abc"
+BENIGN = [{f"k{i}": f"What is the capital {i}"} for i in range(40)]
+
+
+def tiny_tokenizer():
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    tok = Tokenizer(models.BPE(unk_token="<unk>"))
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=300, special_tokens=["<unk>", "<s>", "</s>", "<pad>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tok.train_from_iterator(['{"k1": "What is the capital", "abc": "Who wrote it"} system: Locate the key'] * 20, trainer)
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tok, bos_token="<s>", eos_token="</s>", unk_token="<unk>", pad_token="<pad>"
+    )
+
+
+def tiny_model(vocab_size):
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=vocab_size, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=4096,
+        bos_token_id=1, eos_token_id=2, pad_token_id=3
+    )
+    return transformers.LlamaForCausalLM(config).eval()
+
+
+class TinyProcessor(HuggingFaceProcessor):
+    model_id = "tiny"
+
+
+def prompt_text(position, question):
+    entries = BENIGN.copy()
+    entries.insert(position, {UUID: question})
+    merged = {}
+    for entry in entries:
+        merged.update(entry)
+    return "system: Locate the key abc\n" + json.dumps(merged) + "\nAssistant:"
+
+
+def test_prefix_cache_is_safe_under_concurrent_callers():
+    tokenizer = tiny_tokenizer()
+    model = tiny_model(len(tokenizer))
+    processor = TinyProcessor(prefix_cache_mb=50)
+    processor.tokenizer, processor.model = tokenizer, model
+
+    cells = [(position, question) for position in (0, 10, 20, 30, 40) for question in ("Who wrote it", "What is it")] * 3
+
+    def run(cell):
+        text = prompt_text(*cell)
+        input_ids = tokenizer(text, return_tensors="pt").input_ids
+        cached = processor.generate_with_prefix_cache(input_ids, text, json.dumps(UUID) + ": ", max_new_tokens=4, do_sample=False)
+        return input_ids, cached
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        outputs = list(executor.map(run, cells))
+
+    for input_ids, cached in outputs:
+        expected = model.generate(input_ids=input_ids, max_new_tokens=4, do_sample=False)
+        assert torch.equal(cached, expected)
+    assert processor.prefix_cache.stats()["hits"] + processor.prefix_cache.stats()["extensions"] > 0
@@ -0,0 +1,38 @@
+import itertools
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("tiktoken")
+
+from prepare_data import budget_output_path, records_within_budget, write_budget_files
+
+
+def reference_count(record_tokens, max_tokens):
+    # The original loop: cycle over the records until the next one would exceed the budget
+    total, count = 0, 0
+    for tokens in itertools.cycle(record_tokens):
+        if total + tokens > max_tokens:
+            return count
+        total += tokens
+        count += 1
+
+
+@pytest.mark.parametrize("max_tokens", [0, 1, 6, 7, 20, 21, 100, 1234])
+def test_records_within_budget_matches_the_cycling_loop(max_tokens):
+    record_tokens = [3, 1, 4, 1, 5, 9, 2, 6]
+    assert records_within_budget(record_tokens, max_tokens) == reference_count(record_tokens, max_tokens)
+
+
+def test_records_within_budget_rejects_empty_records():
+    with pytest.raises(ValueError):
+        records_within_budget([0, 0], 10)
+
+
+def test_write_budget_files_cycles_records(tmp_path):
+    output_path = str(tmp_path / "benign.jsonl")
+    write_budget_files(["a", "b", "c"], {10: 2, 20: 5}, output_path)
+    with open(budget_output_path(output_path, 10, 2)) as i_file:
+        assert i_file.read().split() == ["a", "b"]
+    with open(budget_output_path(output_path, 20, 2)) as i_file:
+        assert i_file.read().split() == ["a", "b", "c", "a", "b"]
@@ -0,0 +1,37 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+np = pytest.importorskip("numpy")
+
+from utils.resampling import bootstrap_ci, heterogeneity_test, permutation_tests
+
+COUNTS = pd.DataFrame({
+    "experiment": ["long_math"] * 3,
+    "model": ["gpt-4o-mini"] * 3,
+    "insert_position": [0, 500, 1000],
+    "n": [60, 60, 0],
+    "successes": [12, 30, 0],
+})
+PAIRS = [((60, 12), (60, 30)), ((40, 20), (40, 21))]
+
+
+def test_bootstrap_is_reproducible_across_worker_counts():
+    single = bootstrap_ci(COUNTS, resamples=6000, seed=3, workers=1)
+    spread = bootstrap_ci(COUNTS, resamples=6000, seed=3, workers=2)
+    pd.testing.assert_frame_equal(single, spread)
+    # Empty groups are dropped and every interval contains its accuracy
+    assert single["insert_position"].tolist() == [0, 500]
+    assert ((single["ci_low"] <= single["accuracy"]) & (single["accuracy"] <= single["ci_high"])).all()
+
+
+def test_permutation_tests_are_reproducible_across_worker_counts():
+    single = permutation_tests(PAIRS, resamples=6000, seed=3, workers=1)
+    spread = permutation_tests(PAIRS, resamples=6000, seed=3, workers=3)
+    pd.testing.assert_frame_equal(single, spread)
+    assert single["p_value"][0] < 0.01 < single["p_value"][1]
+
+
+def test_heterogeneity_seed():
+    first = heterogeneity_test([60, 60], [12, 30], resamples=3000, seed=1)
+    assert first == heterogeneity_test([60, 60], [12, 30], resamples=3000, seed=1, workers=2)
+    assert first["p_value"] < 0.01
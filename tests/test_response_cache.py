@@ -0,0 +1,61 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils.response_cache import CacheMiss, ResponseCache
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def test_readwrite_stores_and_replay_serves_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path)
+    calls = []
+    create = lambda: calls.append(1) or "Hello"
+    assert cache.get_or_create("gpt-4o-mini", MESSAGES, {"temperature": 0}, create) == "Hello"
+    assert cache.get_or_create("gpt-4o-mini", MESSAGES, {"temperature": 0}, create) == "Hello"
+    assert len(calls) == 1
+    # Failed calls are not cached
+    assert cache.get_or_create("gpt-4o-mini", MESSAGES, {"temperature": 1}, lambda: None) is None
+    cache.close()
+
+    replay = ResponseCache(path, mode="replay")
+    assert replay.get_or_create("gpt-4o-mini", MESSAGES, {"temperature": 0}, create) == "Hello"
+    with pytest.raises(CacheMiss):
+        replay.get_or_create("gpt-4o-mini", MESSAGES, {"temperature": 1}, create)
+    assert len(calls) == 1
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, "m", key)
+        time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "m", "c")
+    assert cache.stats()["entries"] == 2
+    assert cache.get("b") is None and cache.get("a") == "a"
+
+
+def test_put_evicts_above_max_bytes(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=10)
+    for key in ("a", "b", "c"):
+        cache.put(key, "m", key * 4)
+        time.sleep(0.01)
+    assert cache.stats()["entries"] == 2
+    assert cache.get("a") is None
+
+
+def test_run_malicious_uuid_is_stable_across_reruns():
+    pytest.importorskip("openai")
+    pytest.importorskip("dotenv")
+    from generate import run_malicious_uuid
+    args = SimpleNamespace(malicious_uuid=None, cache_path="cache.sqlite", dataset_path="data.jsonl",
+                           prompt_key="question", model="gpt-4o-mini", system_prompt="default")
+    assert run_malicious_uuid(args, []) == run_malicious_uuid(args, [])
+    # Resumed rows keep the UUID they were generated with
+    assert run_malicious_uuid(args, [{"mal_question": {"resumed": "Harmful?"}}]) == "resumed"
+    args.cache_path = None
+    assert run_malicious_uuid(args, []) is None
@@ -0,0 +1,60 @@
+import argparse
+import json
+
+import pytest
+
+from merge_shards import merge_shards
+from utils.checkpoint import read_jsonl_rows
+from utils.sharding import in_shard, parse_shard, shard_output_path, shard_size, write_manifest
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    for spec in ("4/4", "-1/4", "0/0", "1-4"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(spec)
+
+
+@pytest.mark.parametrize("grid_size, count", [(10, 3), (12, 4), (2, 5)])
+def test_shards_partition_the_grid(grid_size, count):
+    members = [[idx for idx in range(grid_size) if in_shard(idx, (index, count))] for index in range(count)]
+    assert sorted(idx for shard in members for idx in shard) == list(range(grid_size))
+    assert [len(shard) for shard in members] == [shard_size(grid_size, (index, count)) for index in range(count)]
+
+
+def write_shards(output_path, grid_size, count, uuids):
+    for index in range(count):
+        path = shard_output_path(output_path, (index, count))
+        with open(path, 'w') as o_file:
+            for idx in range(index, grid_size, count):
+                o_file.write(json.dumps({"idx": idx + 1, "output": f"out {idx}"}) + "\n")
+        write_manifest(path, {
+            "shard": [index, count], "grid_size": grid_size, "shard_size": shard_size(grid_size, (index, count)),
+            "model": "gpt-4o-mini", "system_prompt": "long_math", "dataset_path": "data.jsonl",
+            "num_questions": 1, "step_size": 1, "positions": None, "malicious_uuid": uuids[index],
+            })
+
+
+def test_merge_restores_grid_order(tmp_path):
+    output_path = str(tmp_path / "gen.jsonl")
+    write_shards(output_path, 7, 3, ["u"] * 3)
+    assert merge_shards(output_path, 3)["merged"] == 7
+    assert [row["idx"] for row in read_jsonl_rows(output_path)] == list(range(1, 8))
+
+
+def test_merge_rejects_mismatched_malicious_uuid(tmp_path):
+    output_path = str(tmp_path / "gen.jsonl")
+    write_shards(output_path, 7, 3, ["u", "u", "relaunched"])
+    with pytest.raises(ValueError, match="malicious_uuid"):
+        merge_shards(output_path, 3)
+
+
+def test_merge_reports_missing_cells(tmp_path):
+    output_path = str(tmp_path / "gen.jsonl")
+    write_shards(output_path, 7, 3, ["u"] * 3)
+    rows = read_jsonl_rows(shard_output_path(output_path, (1, 3)))
+    with open(shard_output_path(output_path, (1, 3)), 'w') as o_file:
+        o_file.write(json.dumps({**rows[0], "output": None}) + "\n")
+    with pytest.raises(ValueError, match="rerun shards \\[1\\]"):
+        merge_shards(output_path, 3)
+    assert merge_shards(output_path, 3, allow_incomplete=True)["missing"] == 2
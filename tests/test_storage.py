@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from utils.storage import columnar_paths, export_columnar, has_columnar, load_table, read_columnar
+
+ROWS = [
+    {"idx": i + 1, "mal_q_id": f"q{i % 2}", "insert_position": 50 * i, "token_offset": None,
+     "output": f"Generation {i}", "mal_question": {"uuid-1": f"Question {i}?"}, "model": "gpt-4o-mini"}
+    for i in range(5)
+]
+
+
+@pytest.fixture
+def jsonl_path(tmp_path):
+    path = str(tmp_path / "long_math.jsonl")
+    with open(path, 'w') as o_file:
+        for row in ROWS:
+            o_file.write(json.dumps(row) + "\n")
+    return path
+
+
+def test_round_trip(jsonl_path):
+    export_columnar(jsonl_path)
+    assert has_columnar(jsonl_path)
+    df = read_columnar(jsonl_path)
+    assert sorted(df.columns) == sorted(ROWS[0])
+    assert df["mal_question"].tolist() == [row["mal_question"] for row in ROWS]
+    assert df["output"].tolist() == [row["output"] for row in ROWS]
+    assert df["idx"].tolist() == [row["idx"] for row in ROWS]
+
+
+def test_projection_skips_the_text_file(jsonl_path):
+    export_columnar(jsonl_path)
+    os.remove(columnar_paths(jsonl_path)[1])
+    df = read_columnar(jsonl_path, ["mal_q_id", "insert_position", "missing"])
+    assert list(df.columns) == ["mal_q_id", "insert_position"]
+    assert df["mal_q_id"].astype(str).tolist() == ["q0", "q1", "q0", "q1", "q0"]
+
+
+def test_load_table_falls_back_to_a_newer_jsonl(jsonl_path):
+    export_columnar(jsonl_path)
+    table_path = columnar_paths(jsonl_path)[0]
+    stale = os.path.getmtime(table_path) - 10
+    os.utime(table_path, (stale, stale))
+    with open(jsonl_path, 'a') as o_file:
+        o_file.write(json.dumps({**ROWS[0], "idx": 6}) + "\n")
+    assert not has_columnar(jsonl_path)
+    assert load_table(jsonl_path, ["idx", "output"])["idx"].tolist() == [1, 2, 3, 4, 5, 6]